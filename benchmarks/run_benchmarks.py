@@ -0,0 +1,218 @@
+# Benchmarks of the feature pipeline stages and dashboard aggregations on synthetic data
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'src'))
+from synthetic_data import generate_dataset, parse_rows
+import analytics
+from analytics import FilterSpec
+
+# Generated datasets and run results are kept here. Baselines are committed,
+# but timings only compare on the machine that recorded them
+DATASET_DIR = os.path.join(BENCH_DIR, 'data')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+BASELINE_DIR = os.path.join(BENCH_DIR, 'baselines')
+
+# Dashboard aggregations and their extra arguments after the filter key
+DASHBOARD_AGGREGATIONS = [
+    ('kpi_metrics', ()),
+    ('daily_revenue', ()),
+    ('revenue_forecast', ()),
+    ('monthly_revenue', ()),
+    ('segment_counts', ()),
+    ('top_customers', ()),
+    ('top_products', ('Quantity',)),
+    ('top_products', ('TotalPrice',)),
+    ('country_revenue', ()),
+    ('country_customers', ()),
+    ('hourly_revenue', ()),
+    ('customer_values', ()),
+    ('order_frequency', ()),
+    ('monthly_growth', ()),
+    ('segment_performance', ()),
+    ('category_performance', ('QuantityCategory',)),
+    ('product_performance', ()),
+    ('price_demand', ()),
+    ('weekday_revenue', ()),
+    ('order_size_distribution', ()),
+    ('business_metrics', ()),
+    ('weekday_hour_revenue', ()),
+    ('quarterly_performance', ()),
+    ('customer_acquisition', ()),
+    ('monthly_active_customers', ()),
+    ('churn_distribution', ()),
+    ('customer_activity', ()),
+    ('product_demand_trend', ()),
+    ('market_opportunity', ())
+]
+
+# Slower by more than this fraction and this many milliseconds counts as a regression
+DEFAULT_TOLERANCE = 0.25
+NOISE_FLOOR_MS = 5.0
+
+def run_pipeline(data_dir, report_path, pipeline_args):
+    """Run the feature pipeline on a data directory with profiling and return its run report"""
+    print(f"Running feature pipeline {' '.join(pipeline_args)}...")
+    command = [sys.executable, os.path.join(PROJECT_ROOT, 'src', 'feature_engineering.py'),
+               '--report', report_path] + pipeline_args
+    env = dict(os.environ, RETAIL_DATA_DIR=data_dir)
+    subprocess.run(command, check=True, env=env, stdout=subprocess.DEVNULL)
+    with open(report_path) as f:
+        return json.load(f)
+
+def pipeline_timings(report):
+    """Per-stage and total wall time in ms from a pipeline run report"""
+    timings = {f"pipeline/{name}": round(total['wall_s'] * 1000, 2) for name, total in report['summary'].items()}
+    timings['pipeline/total'] = round(report['wall_s'] * 1000, 2)
+    return timings
+
+def filter_scenarios(df):
+    """Filter keys covering the whole dataset, one quarter, one country and a country/segment pair"""
+    start = df['InvoiceDate'].min().date()
+    # The busiest country after the home market, and the largest segment
+    country = df['Country'].value_counts().index[min(1, df['Country'].nunique() - 1)]
+    segment = df['CustomerSegment'].value_counts().index[0]
+    return {
+        'all': FilterSpec(),
+        'quarter': FilterSpec(start, start + timedelta(days=90)),
+        'country': FilterSpec(country=country),
+        'country_segment': FilterSpec(country=country, segment=segment)
+    }
+
+def time_call(func, args, repeat, reset=None):
+    """Median wall time in ms of a call, running reset (e.g. a cache clear) before each one"""
+    samples = []
+    for _ in range(repeat):
+        if reset is not None:
+            reset()
+        start = time.perf_counter()
+        func(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(sorted(samples)[len(samples) // 2], 2)
+
+def dashboard_timings(data_dir, repeat):
+    """Cold wall time in ms of the dashboard data loading, filtering and metrics, through the headless analytics API"""
+    print("Timing dashboard aggregations...")
+    data = analytics.RetailData(data_dir)
+    timings = {
+        'dashboard/load_data': time_call(data.data, (), repeat, lambda: data.clear('data')),
+        'dashboard/load_rollups': time_call(data.rollups, (), repeat, lambda: data.clear('rollups')),
+        'dashboard/get_filter_index': time_call(data.filter_index, (), repeat, lambda: data.clear('filter_index')),
+        'dashboard/get_kpi_prefix_sums': time_call(data.kpi_prefix_sums, (), repeat,
+                                                   lambda: data.clear('kpi_prefix_sums'))
+    }
+    for scenario, filters in filter_scenarios(data.data()).items():
+        timings[f"dashboard/{scenario}/get_filtered_data"] = time_call(
+            data.filtered_data, (filters,), repeat, data.filtered_data.cache_clear)
+        timings[f"dashboard/{scenario}/get_filtered_rollups"] = time_call(
+            data.filtered_rollups, (filters,), repeat, data.filtered_rollups.cache_clear)
+        # Metrics reuse the slices kept above, as they do within a dashboard rerun
+        data.filtered_data(filters)
+        data.filtered_rollups(filters)
+        # Per-key totals are dropped before each call, so every ranking pays for its own
+        for name, args in DASHBOARD_AGGREGATIONS:
+            label = '_'.join([name] + [str(arg) for arg in args])
+            timings[f"dashboard/{scenario}/{label}"] = time_call(getattr(analytics, name), (data, filters) + args, repeat,
+                                                                 data.group_totals.cache_clear)
+    return timings
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Print current against baseline timings and return the names of the regressions"""
+    regressions = []
+    print(f"{'Benchmark':<60}{'Baseline (ms)':>15}{'Current (ms)':>15}{'Change':>10}")
+    for name, current in results['timings'].items():
+        before = baseline['timings'].get(name)
+        if before is None:
+            print(f"{name:<60}{'-':>15}{current:>15.2f}{'new':>10}")
+            continue
+        change = (current - before) / before if before else 0.0
+        regressed = change > tolerance and current - before > NOISE_FLOOR_MS
+        flag = '  REGRESSION' if regressed else ''
+        print(f"{name:<60}{before:>15.2f}{current:>15.2f}{change:>+10.0%}{flag}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Benchmark the feature pipeline and dashboard aggregations")
+    parser.add_argument('--rows', type=parse_rows, default=parse_rows('1m'),
+                        help="Synthetic dataset size, e.g. 1m, 10m or 50m (default: 1m)")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="Random seed of the synthetic data (default: 0)")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Calls per dashboard aggregation; the median is reported (default: 3)")
+    parser.add_argument('--pipeline-args', default='',
+                        help="Extra feature_engineering.py options, e.g. \"--chunksize 1000000\"")
+    parser.add_argument('--skip-pipeline', action='store_true',
+                        help="Reuse the feature tables from the last run on this dataset")
+    parser.add_argument('--skip-dashboard', action='store_true',
+                        help="Only benchmark the feature pipeline")
+    parser.add_argument('--baseline', default=None,
+                        help="Baseline results to compare against (default: benchmarks/baselines/<rows>.json)")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="Store this run as the baseline instead of comparing against it")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f"Allowed slowdown before a benchmark counts as a regression (default: {DEFAULT_TOLERANCE})")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    data_dir = os.path.join(DATASET_DIR, f"{args.rows}_seed{args.seed}")
+    source_path = os.path.join(data_dir, 'Online_Retail_Cleaned.csv')
+    if not os.path.exists(source_path):
+        generate_dataset(args.rows, source_path, args.seed)
+
+    stamp = time.strftime('%Y%m%d_%H%M%S')
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    results = {
+        'rows': args.rows,
+        'seed': args.seed,
+        'pipeline_args': args.pipeline_args,
+        'started_at': stamp,
+        'python': platform.python_version(),
+        'machine': f"{platform.system()} {platform.machine()}, {os.cpu_count()} cores",
+        'timings': {}
+    }
+
+    if not args.skip_pipeline:
+        report = run_pipeline(data_dir, os.path.join(RESULTS_DIR, f"pipeline_{args.rows}_{stamp}.json"),
+                              args.pipeline_args.split())
+        results['timings'].update(pipeline_timings(report))
+        results['peak_rss_mb'] = report['peak_rss_mb']
+    if not args.skip_dashboard:
+        results['timings'].update(dashboard_timings(data_dir, args.repeat))
+
+    results_path = os.path.join(RESULTS_DIR, f"benchmark_{args.rows}_{stamp}.json")
+    with open(results_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to '{results_path}'")
+
+    baseline_path = args.baseline or os.path.join(BASELINE_DIR, f"{args.rows}.json")
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to '{baseline_path}'")
+    elif os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        if baseline.get('machine') != results['machine']:
+            print(f"⚠️ Baseline was recorded on {baseline.get('machine')}, this is {results['machine']}; "
+                  f"store your own with --save-baseline before comparing")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} benchmarks regressed beyond {args.tolerance:.0%}")
+            sys.exit(1)
+        print("No regressions")
+    else:
+        print(f"No baseline at '{baseline_path}'; run with --save-baseline to store one")
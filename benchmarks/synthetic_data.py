@@ -0,0 +1,126 @@
+# Synthetic Online Retail shaped data for reproducible benchmarks
+import pandas as pd
+import numpy as np
+import argparse
+import os
+
+# Countries and their approximate share of invoices in the original dataset
+COUNTRIES = {
+    'UNITED KINGDOM': 0.82, 'GERMANY': 0.035, 'FRANCE': 0.03, 'EIRE': 0.025,
+    'SPAIN': 0.012, 'NETHERLANDS': 0.01, 'BELGIUM': 0.009, 'SWITZERLAND': 0.008,
+    'PORTUGAL': 0.007, 'AUSTRALIA': 0.006, 'NORWAY': 0.006, 'ITALY': 0.006,
+    'CHANNEL ISLANDS': 0.005, 'FINLAND': 0.005, 'CYPRUS': 0.004
+}
+
+# Words the product descriptions are composed from
+COLOURS = ['WHITE', 'RED', 'BLUE', 'PINK', 'GREEN', 'VINTAGE', 'RETRO', 'JUMBO', 'SMALL', 'REGENCY']
+ITEMS = ['HEART T-LIGHT HOLDER', 'LANTERN', 'CAKE CASES', 'LUNCH BAG', 'PARTY BUNTING',
+         'TEACUP AND SAUCER', 'ALARM CLOCK', 'DOORMAT', 'SHOPPER BAG', 'PHOTO FRAME']
+
+# Source data span and size of the catalogue
+START = pd.Timestamp('2010-12-01 08:00')
+DAYS = 373
+PRODUCTS = 4000
+LINES_PER_INVOICE = 20
+ROWS_PER_CUSTOMER = 100
+CANCEL_RATE = 0.015
+MISSING_CUSTOMER_RATE = 0.05
+
+# Rows generated and written at a time, so 50M rows never sit in memory at once
+CHUNK_ROWS = 1_000_000
+
+def parse_rows(value):
+    """Row count from an integer or a 1m/10m/50m style shorthand"""
+    value = str(value).strip().lower().replace('_', '')
+    scale = {'k': 1_000, 'm': 1_000_000}.get(value[-1:], 1)
+    return int(float(value.rstrip('km')) * scale)
+
+def product_catalogue(rng):
+    """Stock codes, descriptions, base prices and Zipf-like popularity of the products"""
+    codes = (10000 + np.arange(PRODUCTS)).astype(str)
+    descriptions = np.array([f"{COLOURS[i % len(COLOURS)]} {ITEMS[(i // len(COLOURS)) % len(ITEMS)]} {i}"
+                             for i in range(PRODUCTS)], dtype=object)
+    prices = np.round(rng.lognormal(1.0, 0.8, PRODUCTS), 2)
+    popularity = 1.0 / np.arange(1, PRODUCTS + 1) ** 0.8
+    return codes, descriptions, prices, popularity / popularity.sum()
+
+def generate_chunk(rng, catalogue, customer_countries, n_rows, first_invoice, start, end):
+    """One chunk of rows whose invoices and dates follow those of the previous chunk"""
+    codes, descriptions, prices, popularity = catalogue
+
+    # Invoices with geometric line counts, numbered and timed in file order
+    sizes = rng.geometric(1.0 / LINES_PER_INVOICE, 2 * (n_rows // LINES_PER_INVOICE) + 10)
+    sizes = sizes[:np.searchsorted(np.cumsum(sizes), n_rows) + 1]
+    sizes[-1] -= sizes.sum() - n_rows
+    n_invoices = len(sizes)
+    invoice_numbers = (first_invoice + np.arange(n_invoices)).astype(str).astype(object)
+    canceled = rng.random(n_invoices) < CANCEL_RATE
+    invoice_numbers[canceled] = 'C' + invoice_numbers[canceled]
+    minutes = int((end - start) / pd.Timedelta(minutes=1))
+    invoice_dates = start + pd.to_timedelta(np.sort(rng.integers(0, max(minutes, 1), n_invoices)), unit='m')
+
+    # Each invoice belongs to one customer, who always buys from the same country
+    customer = rng.integers(0, len(customer_countries), n_invoices)
+    customers = (12346 + customer).astype(float).astype(str).astype(object)
+    customers[rng.random(n_invoices) < MISSING_CUSTOMER_RATE] = np.nan
+    countries = customer_countries[customer]
+
+    invoice = np.repeat(np.arange(n_invoices), sizes)
+    product = rng.choice(PRODUCTS, n_rows, p=popularity)
+    quantity = rng.geometric(0.15, n_rows)
+    quantity = np.where(canceled[invoice], -quantity, quantity)
+    # Prices vary a little around each product's list price
+    unit_price = np.round(prices[product] * rng.choice([0.85, 1.0, 1.0, 1.0, 1.25], n_rows), 2)
+
+    return pd.DataFrame({
+        'InvoiceNo': invoice_numbers[invoice],
+        'StockCode': codes[product],
+        'Description': descriptions[product],
+        'Quantity': quantity,
+        'InvoiceDate': invoice_dates[invoice],
+        'UnitPrice': unit_price,
+        'CustomerID': customers[invoice],
+        'Country': countries[invoice]
+    }), n_invoices
+
+def generate_dataset(n_rows, path, seed=0, chunk_rows=CHUNK_ROWS):
+    """Write an Online_Retail_Cleaned.csv shaped file of n_rows synthetic transactions"""
+    print(f"Generating {n_rows:,} synthetic rows into '{path}'...")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    rng = np.random.default_rng(seed)
+    catalogue = product_catalogue(rng)
+    n_customers = max(n_rows // ROWS_PER_CUSTOMER, 100)
+    shares = np.array(list(COUNTRIES.values()))
+    customer_countries = rng.choice(np.array(list(COUNTRIES), dtype=object), n_customers, p=shares / shares.sum())
+    n_chunks = -(-n_rows // chunk_rows)
+    bounds = START + pd.to_timedelta(np.linspace(0, DAYS, n_chunks + 1), unit='D')
+
+    first_invoice = 536365
+    tmp_path = path + '.tmp'
+    for i in range(n_chunks):
+        rows = min(chunk_rows, n_rows - i * chunk_rows)
+        chunk, n_invoices = generate_chunk(rng, catalogue, customer_countries, rows, first_invoice,
+                                           bounds[i], bounds[i + 1])
+        chunk.to_csv(tmp_path, mode='w' if i == 0 else 'a', header=i == 0, index=False,
+                     date_format='%Y-%m-%d %H:%M:%S')
+        first_invoice += n_invoices
+        print(f"  {min((i + 1) * chunk_rows, n_rows):,} rows written")
+
+    # A partially written file is never left under the final name
+    os.replace(tmp_path, path)
+    return path
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Generate synthetic Online Retail transactions")
+    parser.add_argument('--rows', type=parse_rows, default=parse_rows('1m'),
+                        help="Number of rows, e.g. 1m, 10m or 50m (default: 1m)")
+    parser.add_argument('--output', required=True,
+                        help="Path of the CSV file to write")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="Random seed (default: 0)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    generate_dataset(args.rows, args.output, args.seed)
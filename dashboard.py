@@ -4,8 +4,20 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import numpy as np
-from datetime import datetime, timedelta
+from types import SimpleNamespace
+import os
+import sys
 import warnings
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from data_store import compact_dtypes, current_data_source, table_columns
+from rollups import build_kpi_prefix_sums, build_rollup_cube, filter_cube
+from filter_index import build_filter_index, filter_rows, sort_by_date
+from downsampling import target_points
+from sketches import STANDARD_ERROR
+from topk import group_totals
+import analytics
+from analytics import FilterSpec
+from dashboard_perf import PERF, append_log, cache_table, latency_percentiles, read_log, timing_table
 warnings.filterwarnings('ignore')
 
 # Page configuration
@@ -371,21 +383,61 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Load data function with error handling
-@st.cache_data
+# featured_data columns other than analytics.DASHBOARD_COLUMNS are loaded per column on demand
+EXTRA_COLUMN_CACHE_ENTRIES = 8
+
+# Set RETAIL_MEMORY_REPORT=1 to print per-column memory before/after compaction on load
+MEMORY_REPORT = os.environ.get('RETAIL_MEMORY_REPORT') == '1'
+
+# Set RETAIL_PERF_MODE=1 to start sessions with the performance panel switched on
+PERF_MODE = os.environ.get('RETAIL_PERF_MODE') == '1'
+
+# Number of logged reruns the p50/p95 latency table covers
+PERF_LOG_WINDOW = 200
+
+# Set RETAIL_SHARED_DATA=1 to map the dataset from an Arrow IPC file shared by every
+# session and dashboard process on the host instead of holding a copy per process
+SHARED_DATA = os.environ.get('RETAIL_SHARED_DATA') == '1'
+
+# Set RETAIL_APPROX_DISTINCT=1 to start sessions with sketch-based distinct customer counts
+APPROX_DISTINCT = os.environ.get('RETAIL_APPROX_DISTINCT') == '1'
+
+# Seconds between checks for a newly published data snapshot in an idle session
+DATA_POLL_SECONDS = 30
+
+@st.cache_resource(show_spinner=False)
+def served_data_source():
+    """Data version and table directory this process serves until a newer snapshot is published"""
+    return current_data_source()
+
+def refresh_data_version():
+    """Drop every cached table and aggregation once a newer snapshot has been published"""
+    # Sessions mid-rerun keep the frames they already hold; the next load reads the new snapshot
+    if current_data_source()[0] != served_data_source()[0]:
+        st.cache_data.clear()
+        st.cache_resource.clear()
+
+@st.fragment(run_every=DATA_POLL_SECONDS)
+def watch_data_version(version):
+    """Rerun the app when the published data version changes, and show the version being served"""
+    if current_data_source()[0] != version:
+        st.rerun(scope='app')
+    if version is not None:
+        st.caption(f"🗂️ Data snapshot {version}")
+
+# Load data function with error handling. Shared data is returned as is
+# (cache_resource), since pickling it per access would copy it
+@PERF.cached(st.cache_resource(show_spinner=False) if SHARED_DATA else st.cache_data)
 def load_data():
     """Load and cache the featured data"""
     try:
-        # Try to load from data directory first
-        df = pd.read_csv('data/featured_data.csv', low_memory=False)
-        df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
-        return df
+        return analytics.load_dashboard_data(served_data_source()[1], SHARED_DATA, MEMORY_REPORT)
     except FileNotFoundError:
         try:
             # Fallback: try current directory
             df = pd.read_csv('featured_data.csv', low_memory=False)
             df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
-            return df
+            return sort_by_date(compact_dtypes(df, report=MEMORY_REPORT))
         except FileNotFoundError:
             st.error("❌ Featured data file not found. Please run feature engineering first.")
             st.info("💡 Run the feature engineering script: `python src/feature_engineering.py`")
@@ -394,6 +446,242 @@ def load_data():
         st.error(f"❌ Error loading data: {str(e)}")
         return None
 
+@PERF.cached(st.cache_data)
+def available_columns():
+    """Columns stored in featured_data, whether loaded or not"""
+    try:
+        return table_columns('featured_data', served_data_source()[1])
+    except FileNotFoundError:
+        df = load_data()
+        return list(df.columns) if df is not None else []
+
+@PERF.cached(st.cache_resource(max_entries=EXTRA_COLUMN_CACHE_ENTRIES, show_spinner=False))
+def load_extra_column(col):
+    """Load one featured_data column on demand, row-aligned with load_data()"""
+    return analytics.load_extra_column(load_data(), col, served_data_source()[1])
+
+@PERF.cached(st.cache_data)
+def load_rollups():
+    """Load and cache the rollup cube, building it from the featured data if it was not saved"""
+    cube = analytics.load_rollups(served_data_source()[1])
+    if cube is None:
+        df = load_data()
+        return build_rollup_cube(df) if df is not None else None
+    return cube
+
+@PERF.cached(st.cache_data)
+def load_cohort_retention():
+    """Load the precomputed cohort retention matrix as a cohort x period pivot, or None if it was not saved"""
+    return analytics.load_cohort_retention(served_data_source()[1])
+
+@PERF.cached(st.cache_data)
+def load_customer_sketches():
+    """Load the per-cell customer HyperLogLog sketches, or None if they were not saved"""
+    return analytics.load_customer_sketches(served_data_source()[1])
+
+# Bounded caches for the filter-keyed aggregation layer. Filtered slices are
+# shared objects (no pickling), chart aggregations are small pickled results.
+SLICE_CACHE_ENTRIES = 4
+TOTALS_CACHE_ENTRIES = 16
+AGG_CACHE_ENTRIES = 32
+
+# Approximate plot widths in pixels in the wide layout. Long line charts are
+# downsampled to about one point per pixel before they are sent to the browser
+CHART_WIDTH_PX = {'full': 1400, 'half': 700}
+
+@PERF.cached(st.cache_resource(show_spinner=False))
+def get_filter_index():
+    """Build the date and country/segment row index over the loaded data once per process"""
+    return build_filter_index(load_data())
+
+@PERF.cached(st.cache_resource(max_entries=SLICE_CACHE_ENTRIES, show_spinner=False))
+def get_filtered_data(filters):
+    """Return the transactions matching a (start_date, end_date, country, segment) filter key"""
+    rows = filter_rows(get_filter_index(), *filters)
+    return load_data().iloc[rows]
+
+def get_filtered_column(filters, col):
+    """Return an on-demand column for the rows matching a filter key"""
+    return load_extra_column(col).iloc[filter_rows(get_filter_index(), *filters)]
+
+@PERF.cached(st.cache_resource(show_spinner=False))
+def get_kpi_prefix_sums():
+    """Build the per-day running KPI totals over the rollup cube once per process"""
+    return build_kpi_prefix_sums(load_rollups())
+
+@PERF.cached(st.cache_resource(max_entries=SLICE_CACHE_ENTRIES, show_spinner=False))
+def get_filtered_rollups(filters):
+    """Return the rollup cube cells matching a filter key"""
+    return filter_cube(load_rollups(), *filters)
+
+@PERF.cached(st.cache_resource(max_entries=SLICE_CACHE_ENTRIES, show_spinner=False))
+def get_filtered_sketches(filters):
+    """Return the customer sketch registers of the cells matching a filter key"""
+    return filter_cube(load_customer_sketches(), *filters)
+
+@PERF.cached(st.cache_resource(max_entries=TOTALS_CACHE_ENTRIES, show_spinner=False))
+def get_group_totals(filters, key, measure):
+    """Return the per-key totals of a measure, shared by every chart ranking that key by that measure"""
+    filtered_df = get_filtered_data(filters)
+    return group_totals(filtered_df[key], filtered_df[measure])
+
+# Inputs of the analytics metrics, served from the Streamlit caches above
+SOURCE = SimpleNamespace(
+    filtered_data=get_filtered_data,
+    filtered_column=get_filtered_column,
+    filtered_rollups=get_filtered_rollups,
+    filtered_sketches=get_filtered_sketches,
+    group_totals=get_group_totals,
+    kpi_prefix_sums=get_kpi_prefix_sums,
+    available_columns=available_columns
+)
+
+# Chart aggregations: analytics metrics over the shared slices, each cached per filter key
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def kpi_metrics(filters, approximate=False):
+    """Headline KPIs for the metric cards"""
+    return analytics.kpi_metrics(SOURCE, filters, approximate)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def daily_revenue(filters):
+    """Revenue per day as an InvoiceDate/TotalPrice frame"""
+    return analytics.daily_revenue(SOURCE, filters)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def daily_revenue_points(filters, max_points):
+    """Daily revenue downsampled to about max_points points for line charts"""
+    return analytics.daily_revenue_points(SOURCE, filters, max_points)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def revenue_forecast(filters, horizon=30, max_points=None):
+    """Daily revenue with its linear trend and the trend extended horizon days ahead, or None with 10 days of data or fewer"""
+    return analytics.revenue_forecast(SOURCE, filters, horizon, max_points)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def monthly_revenue(filters):
+    """Revenue per calendar month"""
+    return analytics.monthly_revenue(SOURCE, filters)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def segment_counts(filters):
+    """Transaction lines per customer segment"""
+    return analytics.segment_counts(SOURCE, filters)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def top_customers(filters, n=10):
+    """Customers with the highest revenue"""
+    return analytics.top_customers(SOURCE, filters, n)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def top_products(filters, measure, n=10):
+    """Products with the highest total of a measure (Quantity or TotalPrice)"""
+    return analytics.top_products(SOURCE, filters, measure, n)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def country_revenue(filters, n=10):
+    """Countries with the highest revenue"""
+    return analytics.country_revenue(SOURCE, filters, n)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def country_customers(filters, n=10, approximate=False):
+    """Countries with the most distinct customers"""
+    return analytics.country_customers(SOURCE, filters, n, approximate)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def hourly_revenue(filters):
+    """Revenue per hour of day"""
+    return analytics.hourly_revenue(SOURCE, filters)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def customer_values(filters):
+    """Total revenue per customer"""
+    return analytics.customer_values(SOURCE, filters)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def order_frequency(filters):
+    """Number of customers per order count"""
+    return analytics.order_frequency(SOURCE, filters)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def monthly_growth(filters):
+    """Month-over-month revenue and order growth rates"""
+    return analytics.monthly_growth(SOURCE, filters)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def segment_performance(filters):
+    """Per-segment average revenue, average quantity and line count, normalized to 0-100"""
+    return analytics.segment_performance(SOURCE, filters)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def category_performance(filters, cat_col):
+    """Revenue and quantity per product category"""
+    return analytics.category_performance(SOURCE, filters, cat_col)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def product_performance(filters, n=15):
+    """Revenue, quantity and order count of the top products by revenue"""
+    return analytics.product_performance(SOURCE, filters, n)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def price_demand(filters):
+    """Quantity and revenue per log-spaced unit price bin, excluding free items"""
+    return analytics.price_demand(SOURCE, filters)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def weekday_revenue(filters):
+    """Revenue per day of week, Monday first"""
+    return analytics.weekday_revenue(SOURCE, filters)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def order_size_distribution(filters):
+    """Number of orders per order value band"""
+    return analytics.order_size_distribution(SOURCE, filters)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def business_metrics(filters, approximate=False):
+    """Inputs of the advanced business metrics table"""
+    return analytics.business_metrics(SOURCE, filters, approximate)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def weekday_hour_revenue(filters):
+    """Revenue pivot of day of week against hour of day"""
+    return analytics.weekday_hour_revenue(SOURCE, filters)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def quarterly_performance(filters):
+    """Revenue and orders per quarter"""
+    return analytics.quarterly_performance(SOURCE, filters)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def customer_acquisition(filters):
+    """New customers per month of first purchase"""
+    return analytics.customer_acquisition(SOURCE, filters)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def monthly_active_customers(filters, approximate=False):
+    """Distinct customers per month"""
+    return analytics.monthly_active_customers(SOURCE, filters, approximate)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def churn_distribution(filters):
+    """Customers per churn risk band"""
+    return analytics.churn_distribution(SOURCE, filters)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def customer_activity(filters, n=10):
+    """Customers with the most transaction lines"""
+    return analytics.customer_activity(SOURCE, filters, n)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def product_demand_trend(filters, n=5):
+    """Monthly quantity of the top products by quantity"""
+    return analytics.product_demand_trend(SOURCE, filters, n)
+
+@PERF.cached(st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False))
+def market_opportunity(filters, approximate=False):
+    """Per-country revenue, customers, orders and revenue per customer"""
+    return analytics.market_opportunity(SOURCE, filters, approximate)
+
 # Custom metric card function
 def create_metric_card(title, value, icon):
     """Create a professional metric card"""
@@ -442,6 +730,31 @@ def style_chart(fig, title=""):
     
     return fig
 
+def render_chart(fig, name):
+    """Render a Plotly chart, timing the call in performance mode"""
+    with PERF.timer('chart', name):
+        st.plotly_chart(fig, use_container_width=True)
+
+def render_perf_panel(rerun):
+    """Log a rerun and show its timings, cache hits/misses and the logged p50/p95 latencies"""
+    append_log(rerun)
+    
+    with st.expander("⏱️ Performance", expanded=True):
+        st.markdown(f"**Rerun time:** {rerun['rerun_ms']:,.0f} ms")
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.markdown("**Aggregation and chart timings**")
+            st.dataframe(timing_table(rerun), use_container_width=True)
+        
+        with col2:
+            st.markdown("**Cache hits and misses**")
+            st.dataframe(cache_table(rerun), use_container_width=True)
+        
+        st.markdown(f"**Latency over the last {PERF_LOG_WINDOW} logged reruns**")
+        st.dataframe(latency_percentiles(read_log(last=PERF_LOG_WINDOW)), use_container_width=True)
+
 # Main app
 def main():
     # Header
@@ -452,7 +765,8 @@ def main():
         </div>
     """, unsafe_allow_html=True)
     
-    # Load data
+    # Load data, from the latest published snapshot
+    refresh_data_version()
     df = load_data()
     if df is None:
         return
@@ -480,6 +794,7 @@ def main():
     )
     
     # Customer segment filter
+    selected_segment = 'All'
     if 'CustomerSegment' in df.columns:
         segments = sorted(df['CustomerSegment'].unique())
         selected_segment = st.sidebar.selectbox(
@@ -487,40 +802,49 @@ def main():
             options=['All'] + segments,
             index=0
         )
+
     
-    # Filter data
-    if len(date_range) == 2:
-        filtered_df = df[
-            (df['InvoiceDate'].dt.date >= date_range[0]) & 
-            (df['InvoiceDate'].dt.date <= date_range[1])
-        ]
-    else:
-        filtered_df = df
+    # Distinct customers estimated by merging precomputed sketches, when they were saved
+    sketches_saved = load_customer_sketches() is not None
+    approximate = st.sidebar.checkbox(
+        "≈ Approximate distinct counts",
+        value=APPROX_DISTINCT and sketches_saved,
+        disabled=not sketches_saved,
+        help=f"Estimate distinct customers from HyperLogLog sketches (±{2 * STANDARD_ERROR:.1%} at 95% confidence)"
+    )
+    
+    # Read at the start of the next rerun, before the app is drawn
+    st.sidebar.checkbox(
+        "⏱️ Performance mode",
+        value=PERF_MODE,
+        key='perf_mode',
+        help="Time each aggregation and chart and show cache hit/miss counts"
+    )
     
-    if selected_countries != 'All':
-        filtered_df = filtered_df[filtered_df['Country'] == selected_countries]
+    with st.sidebar:
+        watch_data_version(served_data_source()[0])
     
-    if 'selected_segment' in locals() and selected_segment != 'All':
-        filtered_df = filtered_df[filtered_df['CustomerSegment'] == selected_segment]
+    # Filter key shared by every cached aggregation below
+    if len(date_range) == 2:
+        filters = FilterSpec(date_range[0], date_range[1], selected_countries, selected_segment)
+    else:
+        filters = FilterSpec(None, None, selected_countries, selected_segment)
     
     # Key metrics
+    kpis = kpi_metrics(filters, approximate)
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        total_revenue = filtered_df['TotalPrice'].sum()
-        create_metric_card("Total Revenue", f"${total_revenue:,.0f}", "💰")
+        create_metric_card("Total Revenue", f"${kpis['total_revenue']:,.0f}", "💰")
     
     with col2:
-        total_orders = filtered_df['InvoiceNo'].nunique()
-        create_metric_card("Total Orders", f"{total_orders:,}", "📊")
+        create_metric_card("Total Orders", f"{kpis['total_orders']:,}", "📊")
     
     with col3:
-        total_customers = filtered_df['CustomerID'].nunique()
-        create_metric_card("Total Customers", f"{total_customers:,}", "👥")
+        create_metric_card("Total Customers", f"{kpis['total_customers']:,}", "👥")
     
     with col4:
-        avg_order_value = filtered_df.groupby('InvoiceNo')['TotalPrice'].sum().mean()
-        create_metric_card("Avg Order Value", f"${avg_order_value:.0f}", "💳")
+        create_metric_card("Avg Order Value", f"${kpis['avg_order_value']:.0f}", "💳")
     
     # Tabs for different analyses
     tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs([
@@ -540,22 +864,21 @@ def main():
         
         with col1:
             # Revenue trend
-            daily_revenue = filtered_df.groupby(filtered_df['InvoiceDate'].dt.date)['TotalPrice'].sum().reset_index()
-            fig = px.line(daily_revenue, x='InvoiceDate', y='TotalPrice',
-                         title='Daily Revenue Trend')
+            fig = px.line(daily_revenue_points(filters, target_points(CHART_WIDTH_PX['half'])),
+                         x='InvoiceDate', y='TotalPrice', title='Daily Revenue Trend')
             fig.update_traces(line_color='#3498db', line_width=3)
             fig = style_chart(fig)
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart(fig, 'Daily Revenue Trend')
         
         with col2:
             # Monthly revenue
-            monthly_revenue = filtered_df.groupby(filtered_df['InvoiceDate'].dt.to_period('M'))['TotalPrice'].sum().reset_index()
-            monthly_revenue['InvoiceDate'] = monthly_revenue['InvoiceDate'].astype(str)
-            fig = px.bar(monthly_revenue, x='InvoiceDate', y='TotalPrice',
+            monthly_data = monthly_revenue(filters)
+            fig = px.bar(x=monthly_data.index.astype(str), y=monthly_data.values,
+                        labels={'x': 'InvoiceDate', 'y': 'TotalPrice'},
                         title='Monthly Revenue')
             fig.update_traces(marker_color='#e74c3c')
             fig = style_chart(fig)
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart(fig, 'Monthly Revenue')
         
         st.markdown('</div>', unsafe_allow_html=True)
     
@@ -566,20 +889,20 @@ def main():
         
         with col1:
             # Customer distribution
-            if 'CustomerSegment' in filtered_df.columns:
-                segment_counts = filtered_df['CustomerSegment'].value_counts()
-                fig = px.pie(values=segment_counts.values, names=segment_counts.index,
+            if 'CustomerSegment' in df.columns:
+                segment_data = segment_counts(filters)
+                fig = px.pie(values=segment_data.values, names=segment_data.index,
                            title='Customer Segmentation')
                 fig.update_traces(textinfo='percent+label')
                 fig = style_chart(fig)
-                st.plotly_chart(fig, use_container_width=True)
+                render_chart(fig, 'Customer Segmentation')
         
         with col2:
             # Top customers
-            top_customers = filtered_df.groupby('CustomerID')['TotalPrice'].sum().nlargest(10)
+            customer_revenue = top_customers(filters)
             # Handle both numeric and string customer IDs
             customer_labels = []
-            for x in top_customers.index:
+            for x in customer_revenue.index:
                 if pd.isna(x) or str(x).lower() in ['nan', 'none', 'unknown_customer']:
                     customer_labels.append("Unknown Customer")
                 elif str(x).replace('.', '').isdigit():
@@ -587,11 +910,11 @@ def main():
                 else:
                     customer_labels.append(f"Customer {str(x)[:15]}")
             
-            fig = px.bar(x=top_customers.values, y=customer_labels,
+            fig = px.bar(x=customer_revenue.values, y=customer_labels,
                         title='Top 10 Customers by Revenue', orientation='h')
             fig.update_traces(marker_color='#f39c12')
             fig = style_chart(fig)
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart(fig, 'Top 10 Customers by Revenue')
         
         st.markdown('</div>', unsafe_allow_html=True)
     
@@ -602,23 +925,23 @@ def main():
         
         with col1:
             # Top products
-            top_products = filtered_df.groupby('Description')['Quantity'].sum().nlargest(10)
-            fig = px.bar(x=top_products.index, y=top_products.values,
+            product_quantity = top_products(filters, 'Quantity')
+            fig = px.bar(x=product_quantity.index, y=product_quantity.values,
                         title='Top 10 Products by Quantity')
             fig.update_traces(marker_color='#27ae60')
             fig.update_xaxes(tickangle=45)
             fig = style_chart(fig)
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart(fig, 'Top 10 Products by Quantity')
         
         with col2:
             # Product revenue
-            product_revenue = filtered_df.groupby('Description')['TotalPrice'].sum().nlargest(10)
+            product_revenue = top_products(filters, 'TotalPrice')
             fig = px.bar(x=product_revenue.index, y=product_revenue.values,
                         title='Top 10 Products by Revenue')
             fig.update_traces(marker_color='#9b59b6')
             fig.update_xaxes(tickangle=45)
             fig = style_chart(fig)
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart(fig, 'Top 10 Products by Revenue')
         
         st.markdown('</div>', unsafe_allow_html=True)
     
@@ -629,23 +952,23 @@ def main():
         
         with col1:
             # Country revenue
-            country_revenue = filtered_df.groupby('Country')['TotalPrice'].sum().nlargest(10)
-            fig = px.bar(x=country_revenue.index, y=country_revenue.values,
+            country_totals = country_revenue(filters)
+            fig = px.bar(x=country_totals.index, y=country_totals.values,
                         title='Revenue by Country')
             fig.update_traces(marker_color='#e67e22')
             fig.update_xaxes(tickangle=45)
             fig = style_chart(fig)
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart(fig, 'Revenue by Country')
         
         with col2:
             # Country customers
-            country_customers = filtered_df.groupby('Country')['CustomerID'].nunique().nlargest(10)
-            fig = px.bar(x=country_customers.index, y=country_customers.values,
+            country_counts = country_customers(filters, approximate=approximate)
+            fig = px.bar(x=country_counts.index, y=country_counts.values,
                         title='Customers by Country')
             fig.update_traces(marker_color='#34495e')
             fig.update_xaxes(tickangle=45)
             fig = style_chart(fig)
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart(fig, 'Customers by Country')
         
         st.markdown('</div>', unsafe_allow_html=True)
     
@@ -660,34 +983,33 @@ def main():
         
         with col1:
             # Revenue distribution by hour
-            if 'Hour' in filtered_df.columns:
-                hourly_data = filtered_df.groupby('Hour')['TotalPrice'].sum()
+            if 'Hour' in df.columns:
+                hourly_data = hourly_revenue(filters)
                 fig = px.bar(x=hourly_data.index, y=hourly_data.values,
                            title='Revenue by Hour of Day',
                            labels={'x': 'Hour', 'y': 'Revenue'})
                 fig.update_traces(marker_color='#3498db')
                 fig = style_chart(fig)
-                st.plotly_chart(fig, use_container_width=True)
+                render_chart(fig, 'Revenue by Hour of Day')
         
         with col2:
             # Customer lifetime value distribution
-            clv_data = filtered_df.groupby('CustomerID')['TotalPrice'].sum()
+            clv_data = customer_values(filters)
             fig = px.histogram(x=clv_data.values, nbins=20,
                              title='Customer Lifetime Value Distribution')
             fig.update_traces(marker_color='#e74c3c')
             fig = style_chart(fig)
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart(fig, 'Customer Lifetime Value Distribution')
         
         with col3:
             # Order frequency analysis
-            order_freq = filtered_df.groupby('CustomerID')['InvoiceNo'].nunique()
-            freq_dist = order_freq.value_counts().sort_index()
+            freq_dist = order_frequency(filters)
             fig = px.bar(x=freq_dist.index, y=freq_dist.values,
                         title='Order Frequency Distribution',
                         labels={'x': 'Number of Orders', 'y': 'Number of Customers'})
             fig.update_traces(marker_color='#f39c12')
             fig = style_chart(fig)
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart(fig, 'Order Frequency Distribution')
         
         # Row 2: Cohort and Trend Analysis
         st.markdown('<h3 class="section-header">📊 Advanced Analytics Dashboard</h3>', unsafe_allow_html=True)
@@ -696,16 +1018,7 @@ def main():
         
         with col1:
             # Monthly growth analysis
-            monthly_data = filtered_df.groupby(filtered_df['InvoiceDate'].dt.to_period('M')).agg({
-                'TotalPrice': 'sum',
-                'InvoiceNo': 'nunique',
-                'CustomerID': 'nunique'
-            }).reset_index()
-            monthly_data['Month'] = monthly_data['InvoiceDate'].astype(str)
-            
-            # Calculate growth rates
-            monthly_data['Revenue_Growth'] = monthly_data['TotalPrice'].pct_change() * 100
-            monthly_data['Orders_Growth'] = monthly_data['InvoiceNo'].pct_change() * 100
+            monthly_data = monthly_growth(filters)
             
             fig = go.Figure()
             fig.add_trace(go.Scatter(x=monthly_data['Month'], y=monthly_data['Revenue_Growth'],
@@ -718,20 +1031,12 @@ def main():
             fig.update_layout(title='Month-over-Month Growth Analysis',
                             xaxis_title='Month', yaxis_title='Growth Rate (%)')
             fig = style_chart(fig)
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart(fig, 'Month-over-Month Growth Analysis')
         
         with col2:
             # Customer segmentation radar chart
-            if 'CustomerSegment' in filtered_df.columns:
-                segment_metrics = filtered_df.groupby('CustomerSegment').agg({
-                    'TotalPrice': 'mean',
-                    'Quantity': 'mean',
-                    'InvoiceNo': 'count'
-                }).reset_index()
-                
-                # Normalize metrics for radar chart
-                for col in ['TotalPrice', 'Quantity', 'InvoiceNo']:
-                    segment_metrics[f'{col}_norm'] = (segment_metrics[col] / segment_metrics[col].max()) * 100
+            if 'CustomerSegment' in df.columns:
+                segment_metrics = segment_performance(filters)
                 
                 fig = go.Figure()
                 
@@ -751,21 +1056,30 @@ def main():
                     title='Customer Segment Performance Radar'
                 )
                 fig = style_chart(fig)
-                st.plotly_chart(fig, use_container_width=True)
+                render_chart(fig, 'Customer Segment Performance Radar')
+        
+        # Cohort retention, precomputed over all customers by the feature pipeline
+        retention = load_cohort_retention()
+        if retention is not None:
+            fig = px.imshow(retention.values * 100,
+                          x=retention.columns,
+                          y=retention.index.astype(str),
+                          title='Cohort Retention: % of Customers Active by Months Since First Purchase',
+                          labels={'x': 'Months Since First Purchase', 'y': 'Cohort', 'color': 'Retention %'},
+                          color_continuous_scale='Blues')
+            fig = style_chart(fig)
+            render_chart(fig, 'Cohort Retention')
         
         # Row 3: Product and Market Analysis
         col1, col2 = st.columns(2)
         
         with col1:
             # Product category performance (if available)
-            if any(col.startswith('Product') for col in filtered_df.columns):
+            if any(col.startswith('Product') for col in available_columns()):
                 # Try to find product category column
-                cat_col = next((col for col in filtered_df.columns if 'Category' in col or 'Type' in col), None)
+                cat_col = next((col for col in available_columns() if 'Category' in col or 'Type' in col), None)
                 if cat_col:
-                    cat_performance = filtered_df.groupby(cat_col).agg({
-                        'TotalPrice': 'sum',
-                        'Quantity': 'sum'
-                    }).reset_index()
+                    cat_performance = category_performance(filters, cat_col)
                     
                     fig = px.scatter(cat_performance, x='Quantity', y='TotalPrice',
                                    size='TotalPrice', hover_name=cat_col,
@@ -773,14 +1087,10 @@ def main():
                                    labels={'Quantity': 'Total Quantity Sold', 'TotalPrice': 'Total Revenue'})
                     fig.update_traces(marker=dict(color='#9b59b6', line=dict(width=2, color='white')))
                     fig = style_chart(fig)
-                    st.plotly_chart(fig, use_container_width=True)
+                    render_chart(fig, 'Product Category Performance Matrix')
                 else:
                     # Alternative: Top products bubble chart
-                    product_perf = filtered_df.groupby('Description').agg({
-                        'TotalPrice': 'sum',
-                        'Quantity': 'sum',
-                        'InvoiceNo': 'nunique'
-                    }).reset_index().nlargest(15, 'TotalPrice')
+                    product_perf = product_performance(filters)
                     
                     fig = px.scatter(product_perf, x='Quantity', y='TotalPrice',
                                    size='InvoiceNo', hover_name='Description',
@@ -788,22 +1098,22 @@ def main():
                                    labels={'Quantity': 'Total Quantity', 'TotalPrice': 'Revenue'})
                     fig.update_traces(marker=dict(color='#9b59b6', line=dict(width=2, color='white')))
                     fig = style_chart(fig)
-                    st.plotly_chart(fig, use_container_width=True)
+                    render_chart(fig, 'Top Products Performance Matrix')
         
         with col2:
             # Price elasticity analysis
-            price_analysis = filtered_df.groupby('UnitPrice').agg({
-                'Quantity': 'sum',
-                'TotalPrice': 'sum'
-            }).reset_index()
-            price_analysis = price_analysis[price_analysis['UnitPrice'] > 0]  # Remove free items
+            price_analysis = price_demand(filters)
             
             fig = px.scatter(price_analysis, x='UnitPrice', y='Quantity',
                            size='TotalPrice', title='Price vs Demand Analysis',
-                           labels={'UnitPrice': 'Unit Price ($)', 'Quantity': 'Total Quantity Sold'})
+                           hover_data=['PriceLow', 'PriceHigh', 'Lines'],
+                           labels={'UnitPrice': 'Avg Unit Price ($)', 'Quantity': 'Total Quantity Sold',
+                                 'PriceLow': 'Bin From ($)', 'PriceHigh': 'Bin To ($)'})
             fig.update_traces(marker=dict(color='#27ae60', line=dict(width=2, color='white')))
             fig = style_chart(fig)
-            st.plotly_chart(fig, use_container_width=True)
+            # Price bins are log-spaced
+            fig.update_xaxes(type='log')
+            render_chart(fig, 'Price vs Demand Analysis')
         
         # Row 4: Time Series Analysis
         st.markdown('<h3 class="section-header">⏰ Time Series Intelligence</h3>', unsafe_allow_html=True)
@@ -812,9 +1122,7 @@ def main():
         
         with col1:
             # Weekly seasonality
-            filtered_df['Weekday'] = filtered_df['InvoiceDate'].dt.day_name()
-            weekday_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-            weekly_data = filtered_df.groupby('Weekday')['TotalPrice'].sum().reindex(weekday_order)
+            weekly_data = weekday_revenue(filters)
             
             fig = px.bar(x=weekly_data.index, y=weekly_data.values,
                         title='Revenue by Day of Week',
@@ -825,25 +1133,18 @@ def main():
                      else '#e74c3c' for day in weekly_data.index]
             fig.update_traces(marker_color=colors)
             fig = style_chart(fig)
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart(fig, 'Revenue by Day of Week')
         
         with col2:
             # Order size distribution
-            order_sizes = filtered_df.groupby('InvoiceNo')['TotalPrice'].sum()
-            
-            # Create order size categories
-            order_categories = pd.cut(order_sizes, 
-                                    bins=[0, 50, 100, 250, 500, float('inf')],
-                                    labels=['<$50', '$50-100', '$100-250', '$250-500', '$500+'])
-            
-            cat_counts = order_categories.value_counts()
+            cat_counts = order_size_distribution(filters)
             
             fig = px.pie(values=cat_counts.values, names=cat_counts.index,
                         title='Order Size Distribution',
                         color_discrete_sequence=['#3498db', '#e74c3c', '#f39c12', '#27ae60', '#9b59b6'])
             fig.update_traces(textinfo='percent+label', textfont_size=12)
             fig = style_chart(fig)
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart(fig, 'Order Size Distribution')
         
         # Enhanced Business Insights
         col1, col2 = st.columns(2)
@@ -876,17 +1177,15 @@ def main():
         st.markdown('<h3 class="section-header">� Advanced Business Metrics</h3>', unsafe_allow_html=True)
         
         # Calculate advanced metrics
-        total_customers = filtered_df['CustomerID'].nunique()
-        total_orders = filtered_df['InvoiceNo'].nunique()
-        total_revenue = filtered_df['TotalPrice'].sum()
-        avg_order_value = total_revenue / total_orders if total_orders > 0 else 0
-        
-        # Customer metrics
-        customer_orders = filtered_df.groupby('CustomerID')['InvoiceNo'].nunique()
-        avg_orders_per_customer = customer_orders.mean()
+        metrics = business_metrics(filters, approximate)
+        total_customers = metrics['total_customers']
+        total_orders = metrics['total_orders']
+        total_revenue = metrics['total_revenue']
+        avg_order_value = metrics['avg_order_value']
+        avg_orders_per_customer = metrics['avg_orders_per_customer']
         
         # Time span
-        date_range = (filtered_df['InvoiceDate'].max() - filtered_df['InvoiceDate'].min()).days
+        date_range = metrics['days']
         
         advanced_metrics = {
             'Metric': [
@@ -907,7 +1206,7 @@ def main():
                 f"{total_customers/max(date_range, 1):.2f} customers/day",
                 f"{total_orders/total_customers:.2f}",
                 f"+{np.random.uniform(5, 15):.1f}%" if total_revenue > 0 else "N/A",
-                f"{len(filtered_df['Country'].unique())} countries"
+                f"{metrics['countries']} countries"
             ],
             'Insight': [
                 'Average value per transaction',
@@ -936,9 +1235,8 @@ def main():
         with col1:
             # Hourly heatmap
             try:
-                if 'Hour' in filtered_df.columns and 'Weekday' in filtered_df.columns:
-                    hourly_heatmap = filtered_df.groupby(['Weekday', 'Hour'])['TotalPrice'].sum().reset_index()
-                    pivot_data = hourly_heatmap.pivot(index='Weekday', columns='Hour', values='TotalPrice')
+                if 'Hour' in df.columns:
+                    pivot_data = weekday_hour_revenue(filters)
                     
                     fig = px.imshow(pivot_data.values, 
                                   x=pivot_data.columns, 
@@ -946,34 +1244,34 @@ def main():
                                   title='Revenue Heatmap: Day vs Hour',
                                   color_continuous_scale='Viridis')
                     fig = style_chart(fig)
-                    st.plotly_chart(fig, use_container_width=True)
+                    render_chart(fig, 'Revenue Heatmap: Day vs Hour')
                 else:
                     # Alternative: Daily trend
-                    daily_trend = filtered_df.groupby(filtered_df['InvoiceDate'].dt.date)['TotalPrice'].sum()
-                    fig = px.line(x=daily_trend.index, y=daily_trend.values,
+                    daily_trend = daily_revenue_points(filters, target_points(CHART_WIDTH_PX['half']))
+                    fig = px.line(x=daily_trend['InvoiceDate'], y=daily_trend['TotalPrice'],
                                  title='Daily Revenue Trend')
                     fig.update_traces(line_color='#3498db', line_width=3)
                     fig = style_chart(fig)
-                    st.plotly_chart(fig, use_container_width=True)
+                    render_chart(fig, 'Daily Revenue Trend (Time Analytics)')
             except Exception as e:
                 # Fallback: Simple daily trend
-                daily_trend = filtered_df.groupby(filtered_df['InvoiceDate'].dt.date)['TotalPrice'].sum()
-                fig = px.line(x=daily_trend.index, y=daily_trend.values,
+                daily_trend = daily_revenue_points(filters, target_points(CHART_WIDTH_PX['half']))
+                fig = px.line(x=daily_trend['InvoiceDate'], y=daily_trend['TotalPrice'],
                              title='Daily Revenue Trend')
                 fig.update_traces(line_color='#3498db', line_width=3)
                 fig = style_chart(fig)
-                st.plotly_chart(fig, use_container_width=True)
+                render_chart(fig, 'Daily Revenue Trend (Time Analytics)')
         
         with col2:
             # Monthly trends with forecast
-            monthly_revenue = filtered_df.groupby(filtered_df['InvoiceDate'].dt.to_period('M'))['TotalPrice'].sum()
+            monthly_data = monthly_revenue(filters)
             
             # Simple moving average forecast
-            moving_avg = monthly_revenue.rolling(window=3).mean()
+            moving_avg = monthly_data.rolling(window=3).mean()
             
             fig = go.Figure()
-            fig.add_trace(go.Scatter(x=[str(x) for x in monthly_revenue.index], 
-                                   y=monthly_revenue.values,
+            fig.add_trace(go.Scatter(x=[str(x) for x in monthly_data.index], 
+                                   y=monthly_data.values,
                                    mode='lines+markers', name='Actual Revenue',
                                    line=dict(color='#3498db', width=3)))
             fig.add_trace(go.Scatter(x=[str(x) for x in moving_avg.index], 
@@ -983,24 +1281,19 @@ def main():
             
             fig.update_layout(title='Revenue Trend with Moving Average')
             fig = style_chart(fig)
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart(fig, 'Revenue Trend with Moving Average')
         
         # Row 2: Seasonal Analysis
         col1, col2 = st.columns(2)
         
         with col1:
             # Quarterly performance
-            quarterly_data = filtered_df.groupby(filtered_df['InvoiceDate'].dt.quarter).agg({
-                'TotalPrice': 'sum',
-                'InvoiceNo': 'nunique',
-                'CustomerID': 'nunique'
-            }).reset_index()
-            quarterly_data['Quarter'] = 'Q' + quarterly_data['InvoiceDate'].astype(str)
+            quarterly_data = quarterly_performance(filters)
             
             fig = go.Figure()
-            fig.add_trace(go.Bar(x=quarterly_data['Quarter'], y=quarterly_data['TotalPrice'],
+            fig.add_trace(go.Bar(x=quarterly_data['Quarter'], y=quarterly_data['Revenue'],
                                name='Revenue', marker_color='#3498db'))
-            fig.add_trace(go.Scatter(x=quarterly_data['Quarter'], y=quarterly_data['InvoiceNo']*1000,
+            fig.add_trace(go.Scatter(x=quarterly_data['Quarter'], y=quarterly_data['Invoices']*1000,
                                    mode='lines+markers', name='Orders (x1000)',
                                    line=dict(color='#e74c3c', width=3), yaxis='y2'))
             
@@ -1010,32 +1303,27 @@ def main():
                 yaxis2=dict(title='Orders', side='right', overlaying='y')
             )
             fig = style_chart(fig)
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart(fig, 'Quarterly Performance Analysis')
         
         with col2:
             # Customer acquisition timeline
             try:
-                if 'FirstPurchaseDate' in filtered_df.columns:
-                    acquisition_data = filtered_df.groupby(filtered_df['FirstPurchaseDate'].dt.to_period('M'))['CustomerID'].nunique()
-                else:
-                    # Alternative: first purchase per customer
-                    first_purchases = filtered_df.groupby('CustomerID')['InvoiceDate'].min()
-                    acquisition_data = first_purchases.dt.to_period('M').value_counts().sort_index()
+                acquisition_data = customer_acquisition(filters)
                 
                 fig = px.line(x=[str(x) for x in acquisition_data.index], y=acquisition_data.values,
                              title='Customer Acquisition Timeline',
                              labels={'x': 'Month', 'y': 'New Customers'})
                 fig.update_traces(line_color='#27ae60', line_width=3)
                 fig = style_chart(fig)
-                st.plotly_chart(fig, use_container_width=True)
+                render_chart(fig, 'Customer Acquisition Timeline')
             except Exception as e:
                 # Fallback: Monthly customer count
-                monthly_customers = filtered_df.groupby(filtered_df['InvoiceDate'].dt.to_period('M'))['CustomerID'].nunique()
+                monthly_customers = monthly_active_customers(filters, approximate)
                 fig = px.line(x=[str(x) for x in monthly_customers.index], y=monthly_customers.values,
                              title='Monthly Active Customers')
                 fig.update_traces(line_color='#27ae60', line_width=3)
                 fig = style_chart(fig)
-                st.plotly_chart(fig, use_container_width=True)
+                render_chart(fig, 'Monthly Active Customers')
         
         st.markdown('</div>', unsafe_allow_html=True)
     
@@ -1048,63 +1336,36 @@ def main():
         
         with col1:
             # Revenue forecast using simple linear regression
-            daily_revenue = filtered_df.groupby(filtered_df['InvoiceDate'].dt.date)['TotalPrice'].sum().reset_index()
-            daily_revenue['InvoiceDate'] = pd.to_datetime(daily_revenue['InvoiceDate'])
-            daily_revenue['Days'] = (daily_revenue['InvoiceDate'] - daily_revenue['InvoiceDate'].min()).dt.days
+            forecast = revenue_forecast(filters, 30, target_points(CHART_WIDTH_PX['half']))
             
-            # Simple linear trend
-            if len(daily_revenue) > 10:
-                z = np.polyfit(daily_revenue['Days'], daily_revenue['TotalPrice'], 1)
-                trend_line = np.poly1d(z)
-                
-                # Forecast next 30 days
-                future_days = np.arange(daily_revenue['Days'].max() + 1, daily_revenue['Days'].max() + 31)
-                future_revenue = trend_line(future_days)
-                future_dates = [daily_revenue['InvoiceDate'].max() + timedelta(days=int(d-daily_revenue['Days'].max())) for d in future_days]
-                
+            if forecast is not None:
+                history = forecast['history']
                 fig = go.Figure()
-                fig.add_trace(go.Scatter(x=daily_revenue['InvoiceDate'], y=daily_revenue['TotalPrice'],
+                fig.add_trace(go.Scatter(x=history['InvoiceDate'], y=history['TotalPrice'],
                                        mode='lines', name='Historical Revenue',
                                        line=dict(color='#3498db', width=2)))
-                fig.add_trace(go.Scatter(x=daily_revenue['InvoiceDate'], y=trend_line(daily_revenue['Days']),
+                fig.add_trace(go.Scatter(x=history['InvoiceDate'], y=history['Trend'],
                                        mode='lines', name='Trend Line',
                                        line=dict(color='#e74c3c', width=2, dash='dash')))
-                fig.add_trace(go.Scatter(x=future_dates, y=future_revenue,
+                fig.add_trace(go.Scatter(x=forecast['forecast']['InvoiceDate'], y=forecast['forecast']['TotalPrice'],
                                        mode='lines', name='30-Day Forecast',
                                        line=dict(color='#f39c12', width=3)))
                 
                 fig.update_layout(title='Revenue Forecast (30 Days)')
                 fig = style_chart(fig)
-                st.plotly_chart(fig, use_container_width=True)
+                render_chart(fig, 'Revenue Forecast (30 Days)')
             else:
                 # If not enough data, show simple trend
-                fig = px.line(daily_revenue, x='InvoiceDate', y='TotalPrice',
+                fig = px.line(daily_revenue(filters), x='InvoiceDate', y='TotalPrice',
                              title='Daily Revenue Trend (Insufficient data for forecast)')
                 fig.update_traces(line_color='#3498db', line_width=3)
                 fig = style_chart(fig)
-                st.plotly_chart(fig, use_container_width=True)
+                render_chart(fig, 'Revenue Forecast (30 Days)')
         
         with col2:
             # Customer churn prediction indicators
             try:
-                customer_metrics = filtered_df.groupby('CustomerID').agg({
-                    'InvoiceDate': ['min', 'max', 'count'],
-                    'TotalPrice': ['sum', 'mean'],
-                    'InvoiceNo': 'nunique'
-                }).reset_index()
-                
-                customer_metrics.columns = ['CustomerID', 'FirstPurchase', 'LastPurchase', 'TotalOrders', 
-                                          'TotalSpent', 'AvgOrderValue', 'UniqueOrders']
-                
-                # Days since last purchase
-                customer_metrics['DaysSinceLastPurchase'] = (filtered_df['InvoiceDate'].max() - customer_metrics['LastPurchase']).dt.days
-                
-                # Churn risk scoring
-                customer_metrics['ChurnRisk'] = pd.cut(customer_metrics['DaysSinceLastPurchase'], 
-                                                     bins=[0, 30, 90, 180, float('inf')],
-                                                     labels=['Low', 'Medium', 'High', 'Critical'])
-                
-                churn_dist = customer_metrics['ChurnRisk'].value_counts()
+                churn_dist = churn_distribution(filters)
                 
                 fig = px.pie(values=churn_dist.values, names=churn_dist.index,
                             title='Customer Churn Risk Distribution',
@@ -1112,29 +1373,27 @@ def main():
                                               'High': '#e67e22', 'Critical': '#e74c3c'})
                 fig.update_traces(textinfo='percent+label')
                 fig = style_chart(fig)
-                st.plotly_chart(fig, use_container_width=True)
+                render_chart(fig, 'Customer Churn Risk Distribution')
             except Exception as e:
                 # Fallback: Simple customer frequency chart
-                customer_freq = filtered_df['CustomerID'].value_counts().head(10)
+                customer_freq = customer_activity(filters)
                 fig = px.bar(x=customer_freq.index, y=customer_freq.values,
                            title='Top 10 Most Active Customers')
                 fig.update_traces(marker_color='#9b59b6')
                 fig = style_chart(fig)
-                st.plotly_chart(fig, use_container_width=True)
+                render_chart(fig, 'Top 10 Most Active Customers')
         
         # Row 2: Market Insights
         col1, col2 = st.columns(2)
         
         with col1:
             # Product demand forecasting
-            product_trend = filtered_df.groupby(['Description', filtered_df['InvoiceDate'].dt.to_period('M')])['Quantity'].sum().reset_index()
-            top_products = filtered_df.groupby('Description')['Quantity'].sum().nlargest(5).index
+            product_trends = product_demand_trend(filters)
             
             fig = go.Figure()
             colors = ['#3498db', '#e74c3c', '#f39c12', '#27ae60', '#9b59b6']
             
-            for i, product in enumerate(top_products):
-                product_data = product_trend[product_trend['Description'] == product]
+            for i, (product, product_data) in enumerate(product_trends.items()):
                 fig.add_trace(go.Scatter(x=[str(x) for x in product_data['InvoiceDate']], 
                                        y=product_data['Quantity'],
                                        mode='lines+markers', name=product[:20] + '...',
@@ -1142,17 +1401,11 @@ def main():
             
             fig.update_layout(title='Top 5 Products Demand Trend')
             fig = style_chart(fig)
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart(fig, 'Top 5 Products Demand Trend')
         
         with col2:
             # Market opportunity matrix
-            country_metrics = filtered_df.groupby('Country').agg({
-                'TotalPrice': 'sum',
-                'CustomerID': 'nunique',
-                'InvoiceNo': 'nunique'
-            }).reset_index()
-            
-            country_metrics['AvgRevenuePerCustomer'] = country_metrics['TotalPrice'] / country_metrics['CustomerID']
+            country_metrics = market_opportunity(filters, approximate)
             
             fig = px.scatter(country_metrics, x='CustomerID', y='AvgRevenuePerCustomer',
                            size='TotalPrice', hover_name='Country',
@@ -1161,7 +1414,7 @@ def main():
                                  'AvgRevenuePerCustomer': 'Revenue per Customer'})
             fig.update_traces(marker=dict(color='#9b59b6', line=dict(width=2, color='white')))
             fig = style_chart(fig)
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart(fig, 'Market Opportunity Matrix')
         
         # Predictive Insights
         col1, col2 = st.columns(2)
@@ -1201,4 +1454,12 @@ def main():
     """, unsafe_allow_html=True)
 
 if __name__ == "__main__":
-    main()
+    if st.session_state.get('perf_mode', PERF_MODE):
+        PERF.start()
+        try:
+            main()
+        finally:
+            rerun = PERF.stop()
+        render_perf_panel(rerun)
+    else:
+        main()
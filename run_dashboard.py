@@ -2,11 +2,59 @@
 """
 Simple script to run the Online Retail Dashboard
 """
+import argparse
 import subprocess
 import sys
 import os
+import threading
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from data_store import DATA_DIR, find_table
+from metrics_service import DEFAULT_PORT as DEFAULT_API_PORT, make_server
+
+# Cleaned source data the background refresh watches for changes
+SOURCE_PATH = os.path.join(DATA_DIR, 'Online_Retail_Cleaned.csv')
+DEFAULT_REFRESH_INTERVAL = 60
+
+def source_mtime():
+    """Modification time of the cleaned source data, or None if it is missing"""
+    try:
+        return os.stat(SOURCE_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def refresh_loop(interval, pipeline_args, stop):
+    """Publish a new data snapshot whenever the source data changes, until stopped"""
+    last_seen = source_mtime()
+    while not stop.wait(interval):
+        mtime = source_mtime()
+        if mtime is None or mtime == last_seen:
+            continue
+        last_seen = mtime
+        print("🔄 Source data changed, building a new snapshot in the background...")
+        command = [sys.executable, 'src/feature_engineering.py', '--snapshot'] + pipeline_args
+        result = subprocess.run(command, stdout=subprocess.DEVNULL)
+        if result.returncode == 0:
+            print("✅ Snapshot published; open dashboards switch to it on their next check")
+        else:
+            print(f"❌ Background refresh failed with exit code {result.returncode}; still serving the last snapshot")
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Run the Online Retail Dashboard")
+    parser.add_argument('--refresh', action='store_true',
+                        help="Rebuild the feature tables as a new snapshot in the background when the source data changes")
+    parser.add_argument('--refresh-interval', type=int, default=DEFAULT_REFRESH_INTERVAL,
+                        help=f"Seconds between checks of the source data (default: {DEFAULT_REFRESH_INTERVAL})")
+    parser.add_argument('--pipeline-args', default='',
+                        help="Extra feature_engineering.py options for refreshes, e.g. \"--incremental\"")
+    parser.add_argument('--api', action='store_true',
+                        help="Also serve the dashboard metrics as JSON over HTTP")
+    parser.add_argument('--api-port', type=int, default=DEFAULT_API_PORT,
+                        help=f"Port of the metrics service (default: {DEFAULT_API_PORT})")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
     print("🚀 Starting Online Retail Dashboard...")
     print("=" * 50)
     
@@ -16,8 +64,8 @@ def main():
         print("Please run this script from the project root directory")
         return
     
-    # Check if featured data exists
-    if not os.path.exists('data/featured_data.csv'):
+    # Check if featured data exists (parquet or csv, in the published snapshot if there is one)
+    if find_table('featured_data')[0] is None:
         print("❌ Error: Featured data not found!")
         print("🔧 Running feature engineering first...")
         try:
@@ -27,6 +75,20 @@ def main():
             print(f"❌ Error running feature engineering: {e}")
             return
     
+    # Background refreshes never block the dashboard; it swaps to each new snapshot itself
+    stop = threading.Event()
+    if args.refresh:
+        threading.Thread(target=refresh_loop, args=(args.refresh_interval, args.pipeline_args.split(), stop),
+                         daemon=True).start()
+        print(f"🔄 Background refresh on: checking '{SOURCE_PATH}' every {args.refresh_interval}s")
+    
+    # The metrics service answers on its own worker threads and follows new snapshots like the dashboard
+    api_server = None
+    if args.api:
+        api_server = make_server(port=args.api_port, shared=os.environ.get('RETAIL_SHARED_DATA') == '1')
+        threading.Thread(target=api_server.serve_forever, daemon=True).start()
+        print(f"🌐 Metrics API will be available at: http://localhost:{args.api_port}/metrics")
+    
     # Start the dashboard
     print("🌟 Starting Streamlit Dashboard...")
     print("📊 Dashboard will be available at: http://localhost:8501")
@@ -39,6 +101,11 @@ def main():
         print("\n👋 Dashboard stopped. Thank you!")
     except Exception as e:
         print(f"❌ Error starting dashboard: {e}")
+    finally:
+        stop.set()
+        if api_server is not None:
+            api_server.shutdown()
+            api_server.server_close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,203 @@
+# Single-pass aggregation of customer, product, country and basket tables
+import pandas as pd
+import numpy as np
+from profiling import pipeline_stage
+
+class KeyGroups:
+    """Factorized key column with its rows sorted by group"""
+
+    def __init__(self, values):
+        codes, uniques = pd.factorize(values, sort=True)
+        if (codes < 0).any():
+            raise ValueError(f"Missing values in key column '{values.name}'")
+        self.codes = codes
+        self.uniques = np.asarray(uniques)
+        self.n = len(uniques)
+        self.counts = np.bincount(codes, minlength=self.n)
+        # Stable sort keeps file order within each group, so the first row is the 'first' value
+        self.order = np.argsort(codes, kind='stable')
+        self.starts = np.concatenate([[0], np.cumsum(self.counts)[:-1]]).astype(np.intp)
+        # Grouping by the codes as a categorical reuses them without hashing the keys again
+        self.grouper = pd.Categorical.from_codes(codes, categories=pd.RangeIndex(self.n))
+
+    def sum(self, values):
+        """Per-group sum in input order, compensated like pandas' groupby sum so means round the same way"""
+        return pd.Series(values, copy=False).groupby(self.grouper, observed=False).sum().to_numpy()
+
+    def m2(self, values, sums):
+        """Per-group sum of squared deviations from the group mean"""
+        means = sums / self.counts
+        return self.sum((values - means[self.codes]) ** 2)
+
+    def min(self, values):
+        """Per-group minimum"""
+        return np.minimum.reduceat(values[self.order], self.starts)
+
+    def max(self, values):
+        """Per-group maximum"""
+        return np.maximum.reduceat(values[self.order], self.starts)
+
+    def first(self, values):
+        """Per-group value of the first row in input order"""
+        return values[self.order[self.starts]]
+
+def unique_pairs(left, right):
+    """Distinct (left, right) group code pairs as a sorted combined int64 key"""
+    return np.unique(left.codes.astype(np.int64) * right.n + right.codes)
+
+def pair_frame(pairs, left, right, left_name, right_name):
+    """Decode combined pair keys into a frame of the two key values"""
+    return pd.DataFrame({
+        left_name: left.uniques[pairs // right.n],
+        right_name: right.uniques[pairs % right.n]
+    })
+
+# Tables produced by aggregate_entities; pair sets hold the distinct key
+# pairs behind the nunique features
+ENTITY_TABLES = ['customer', 'product', 'country', 'basket']
+PAIR_KEYS = {
+    'product_customer': ['StockCode', 'CustomerID'],
+    'product_country': ['StockCode', 'Country'],
+    'country_customer': ['Country', 'CustomerID']
+}
+PAIR_TABLES = list(PAIR_KEYS)
+
+@pipeline_stage
+def aggregate_entities(df, tables=ENTITY_TABLES + PAIR_TABLES, verbose=True):
+    """Aggregate customer/product/country states, key pair sets and baskets over factorized keys"""
+    if verbose:
+        print("Aggregating customer, product, country and basket tables...")
+
+    # Each key column is factorized and sorted at most once
+    groups = {}
+    def keys(col):
+        if col not in groups:
+            groups[col] = KeyGroups(df[col])
+        return groups[col]
+
+    dates = df['InvoiceDate'].values.view('i8')
+    revenue = df['Revenue'].to_numpy(dtype=np.float64)
+    quantity = df['Quantity'].to_numpy(dtype=np.float64)
+    price = df['UnitPrice'].to_numpy(dtype=np.float64)
+    aggregates = {'pairs': {}}
+
+    if 'customer' in tables:
+        customers, countries, invoices = keys('CustomerID'), keys('Country'), keys('InvoiceNo')
+        customer_invoices = unique_pairs(customers, invoices)
+        revenue_sum = customers.sum(revenue)
+        aggregates['customer'] = pd.DataFrame({
+            'FirstPurchase': customers.min(dates).view('datetime64[ns]'),
+            'LastPurchase': customers.max(dates).view('datetime64[ns]'),
+            'Transactions': customers.counts,
+            'Invoices': np.bincount(customer_invoices // invoices.n, minlength=customers.n),
+            'RevenueSum': revenue_sum,
+            'RevenueM2': customers.m2(revenue, revenue_sum),
+            'QuantitySum': customers.sum(quantity).round().astype(np.int64),
+            'UnitPriceSum': customers.sum(price),
+            'Country': countries.uniques[customers.first(countries.codes)]
+        }, index=pd.Index(customers.uniques, name='CustomerID'))
+
+    if 'product' in tables:
+        products = keys('StockCode')
+        price_sum = products.sum(price)
+        aggregates['product'] = pd.DataFrame({
+            'Description': products.first(df['Description'].to_numpy()),
+            'Lines': products.counts,
+            'PriceSum': price_sum,
+            'PriceM2': products.m2(price, price_sum),
+            'MinPrice': products.min(price),
+            'MaxPrice': products.max(price),
+            'QuantitySum': products.sum(quantity).round().astype(np.int64),
+            'RevenueSum': products.sum(revenue)
+        }, index=pd.Index(products.uniques, name='StockCode'))
+
+    if 'country' in tables:
+        countries = keys('Country')
+        aggregates['country'] = pd.DataFrame({
+            'Lines': countries.counts,
+            'RevenueSum': countries.sum(revenue),
+            'QuantitySum': countries.sum(quantity).round().astype(np.int64),
+            'UnitPriceSum': countries.sum(price)
+        }, index=pd.Index(countries.uniques, name='Country'))
+
+    for name, (left, right) in PAIR_KEYS.items():
+        if name in tables:
+            aggregates['pairs'][name] = pair_frame(unique_pairs(keys(left), keys(right)),
+                                                   keys(left), keys(right), left, right)
+
+    if 'basket' in tables:
+        invoices = keys('InvoiceNo')
+        basket_features = pd.DataFrame({
+            'BasketSize': invoices.counts,
+            'Revenue': invoices.sum(revenue),
+            'FirstRow': invoices.order[invoices.starts]
+        }, index=pd.Index(invoices.uniques, name='InvoiceNo'))
+        basket_features['AvgItemValue'] = basket_features['Revenue'] / basket_features['BasketSize']
+        aggregates['basket'] = basket_features
+
+    return aggregates
+
+def _pair_counts(pairs, key):
+    """Number of distinct partners per key in a pair set"""
+    return pairs.groupby(key).size()
+
+def customer_base_features(state):
+    """Customer feature columns derived from a customer state, before scoring"""
+    n = state['Transactions']
+    customer_features = pd.DataFrame({
+        'CustomerID': state.index,
+        'FirstPurchase': state['FirstPurchase'].values,
+        'LastPurchase': state['LastPurchase'].values,
+        'TotalTransactions': n.values,
+        'UniqueInvoices': state['Invoices'].values,
+        'TotalRevenue': state['RevenueSum'].values,
+        'AvgRevenue': (state['RevenueSum'] / n).values,
+        'StdRevenue': np.sqrt(state['RevenueM2'] / (n - 1).replace(0, np.nan)).values,
+        'TotalQuantity': state['QuantitySum'].values,
+        'AvgQuantity': (state['QuantitySum'] / n).values,
+        'AvgUnitPrice': (state['UnitPriceSum'] / n).values,
+        'Country': state['Country'].values
+    }).round(2)
+    for col in ['TotalTransactions', 'UniqueInvoices', 'TotalQuantity']:
+        customer_features[col] = customer_features[col].astype('int64')
+    return customer_features
+
+def product_base_features(state, pairs):
+    """Product feature columns derived from a product state and pair sets, before derived metrics"""
+    n = state['Lines']
+    product_features = pd.DataFrame({
+        'StockCode': state.index,
+        'Description': state['Description'].values,
+        'AvgPrice': (state['PriceSum'] / n).values,
+        'PriceStd': np.sqrt(state['PriceM2'] / (n - 1).replace(0, np.nan)).values,
+        'MinPrice': state['MinPrice'].values,
+        'MaxPrice': state['MaxPrice'].values,
+        'TotalQuantitySold': state['QuantitySum'].values,
+        'AvgQuantityPerOrder': (state['QuantitySum'] / n).values,
+        'TotalOrders': n.values,
+        'TotalRevenue': state['RevenueSum'].values,
+        'AvgRevenuePerOrder': (state['RevenueSum'] / n).values,
+        'UniqueCustomers': _pair_counts(pairs['product_customer'], 'StockCode').reindex(state.index, fill_value=0).values,
+        'CountriesServed': _pair_counts(pairs['product_country'], 'StockCode').reindex(state.index, fill_value=0).values
+    }).round(2)
+    for col in ['TotalQuantitySold', 'TotalOrders']:
+        product_features[col] = product_features[col].astype('int64')
+    return product_features
+
+def country_base_features(state, pairs):
+    """Country feature columns derived from a country state and pair sets, before market share"""
+    n = state['Lines']
+    country_features = pd.DataFrame({
+        'Country': state.index,
+        'TotalRevenue': state['RevenueSum'].values,
+        'AvgRevenue': (state['RevenueSum'] / n).values,
+        'TotalTransactions': n.values,
+        'UniqueCustomers': _pair_counts(pairs['country_customer'], 'Country').reindex(state.index, fill_value=0).values,
+        'UniqueProducts': _pair_counts(pairs['product_country'], 'Country').reindex(state.index, fill_value=0).values,
+        'TotalQuantity': state['QuantitySum'].values,
+        'AvgQuantity': (state['QuantitySum'] / n).values,
+        'AvgUnitPrice': (state['UnitPriceSum'] / n).values
+    }).round(2)
+    for col in ['TotalTransactions', 'TotalQuantity']:
+        country_features[col] = country_features[col].astype('int64')
+    return country_features
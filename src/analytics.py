@@ -0,0 +1,459 @@
+# Dashboard metrics as plain functions over a filter spec, usable without Streamlit
+#
+# Every metric takes a data source and a FilterSpec. A source provides the
+# filtered slices the metrics are computed from:
+#   filtered_data(filters), filtered_column(filters, col), filtered_rollups(filters),
+#   filtered_sketches(filters), group_totals(filters, key, measure),
+#   kpi_prefix_sums() and available_columns()
+# RetailData below is a source that loads the tables itself and keeps them;
+# the dashboard passes one backed by its Streamlit caches instead
+import os
+import threading
+from collections import namedtuple
+from datetime import timedelta
+from functools import lru_cache
+import pandas as pd
+import numpy as np
+from data_store import (DATA_DIR, compact_dtypes, current_data_source, find_table, load_table, map_shared_table,
+                        shared_table_path, table_columns, write_shared_table)
+from rollups import build_kpi_prefix_sums, build_rollup_cube, country_range_totals, filter_cube, range_totals
+from filter_index import build_filter_index, filter_rows, sort_by_date
+from downsampling import downsample
+from price_demand import price_demand_bins
+from sketches import distinct_count
+from topk import group_distinct, group_totals, top_k
+
+# Columns every dashboard rerun needs. Other featured_data columns stay on disk
+# until a metric asks for them through filtered_column()
+DASHBOARD_COLUMNS = [
+    'InvoiceDate', 'InvoiceNo', 'CustomerID', 'Country', 'Description',
+    'Quantity', 'UnitPrice', 'TotalPrice', 'Hour', 'CustomerSegment'
+]
+
+# Inclusive date range (None for open) plus country and customer segment ('All'
+# for no filter). A tuple, so it can key caches
+FilterSpec = namedtuple('FilterSpec', ['start_date', 'end_date', 'country', 'segment'],
+                        defaults=[None, None, 'All', 'All'])
+
+# Filtered slices kept per RetailData; metric results are not cached
+SLICE_CACHE_ENTRIES = 4
+# Per-key totals are small and ranked by several charts, so more of them are kept
+TOTALS_CACHE_ENTRIES = 16
+
+def load_shared_data(data_dir, memory_report=False):
+    """Map the sorted, compacted dashboard columns from their Arrow IPC copy, writing it first if it is stale"""
+    source, _ = find_table('featured_data', data_dir)
+    if source is None:
+        raise FileNotFoundError(f"No stored copy of 'featured_data' found in {data_dir}")
+
+    # The first process to load a new version writes the copy; the rest only map it
+    path = shared_table_path('featured_data', data_dir)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(source):
+        df = load_table('featured_data', columns=DASHBOARD_COLUMNS, data_dir=data_dir)
+        write_shared_table(sort_by_date(compact_dtypes(df, report=memory_report)), path)
+    return map_shared_table(path)
+
+def load_dashboard_data(data_dir, shared=False, memory_report=False):
+    """Load the dashboard columns of featured_data in compact types, sorted by InvoiceDate"""
+    if shared:
+        return load_shared_data(data_dir, memory_report)
+    # Parquet copy when available, featured_data.csv otherwise
+    df = load_table('featured_data', columns=DASHBOARD_COLUMNS, data_dir=data_dir)
+    return sort_by_date(compact_dtypes(df, report=memory_report))
+
+def load_extra_column(data, col, data_dir):
+    """Load one featured_data column, row-aligned with the loaded dashboard data"""
+    if col in data.columns:
+        return data[col]
+
+    # Re-applying the stable date sort to the same InvoiceDate values gives the same row order
+    extra = load_table('featured_data', columns=['InvoiceDate', col], data_dir=data_dir)
+    return sort_by_date(compact_dtypes(extra))[col]
+
+def load_rollups(data_dir):
+    """Load the rollup cube, or None if it was not saved"""
+    try:
+        return compact_dtypes(load_table('rollup_cube', data_dir=data_dir))
+    except FileNotFoundError:
+        return None
+
+def load_cohort_retention(data_dir):
+    """Load the precomputed cohort retention matrix as a cohort x period pivot, or None if it was not saved"""
+    try:
+        retention = load_table('cohort_retention', data_dir=data_dir)
+    except FileNotFoundError:
+        return None
+    return retention.pivot(index='CohortMonth', columns='PeriodNumber', values='RetentionRate')
+
+def load_customer_sketches(data_dir):
+    """Load the per-cell customer HyperLogLog sketches, or None if they were not saved"""
+    try:
+        return load_table('customer_sketches', data_dir=data_dir)
+    except FileNotFoundError:
+        return None
+
+class RetailData:
+    """Metric source that loads the tables on first use and keeps them, for use outside the dashboard"""
+
+    def __init__(self, data_dir=None, shared=False, slice_cache_entries=SLICE_CACHE_ENTRIES,
+                 totals_cache_entries=TOTALS_CACHE_ENTRIES):
+        # The snapshot served from the data directory now is pinned for the life of the object
+        self.version, self.data_dir = current_data_source(data_dir or DATA_DIR)
+        self.shared = shared
+        self._tables = {}
+        # Builds nest (rollups() may need data()), so the lock is reentrant
+        self._lock = threading.RLock()
+        self.filtered_data = lru_cache(slice_cache_entries)(self._filtered_data)
+        self.filtered_rollups = lru_cache(slice_cache_entries)(self._filtered_rollups)
+        self.filtered_sketches = lru_cache(slice_cache_entries)(self._filtered_sketches)
+        self.group_totals = lru_cache(totals_cache_entries)(self._group_totals)
+
+    def _table(self, key, build):
+        """Build a table or index once and keep it, also when several threads ask at once"""
+        if key not in self._tables:
+            with self._lock:
+                if key not in self._tables:
+                    self._tables[key] = build()
+        return self._tables[key]
+
+    def clear(self, key=None):
+        """Drop one kept table (e.g. 'data', 'filter_index') or everything, filtered slices included"""
+        with self._lock:
+            if key is not None:
+                self._tables.pop(key, None)
+            else:
+                self._tables.clear()
+        for cached in (self.filtered_data, self.filtered_rollups, self.filtered_sketches, self.group_totals):
+            cached.cache_clear()
+
+    def data(self):
+        """Dashboard columns of the featured data"""
+        return self._table('data', lambda: load_dashboard_data(self.data_dir, self.shared))
+
+    def available_columns(self):
+        """Columns stored in featured_data, whether loaded or not"""
+        return self._table('columns', lambda: table_columns('featured_data', self.data_dir))
+
+    def extra_column(self, col):
+        """One featured_data column, row-aligned with data()"""
+        return self._table(('column', col), lambda: load_extra_column(self.data(), col, self.data_dir))
+
+    def rollups(self):
+        """Rollup cube, built from data() if it was not saved"""
+        def build():
+            cube = load_rollups(self.data_dir)
+            return build_rollup_cube(self.data(), verbose=False) if cube is None else cube
+        return self._table('rollups', build)
+
+    def cohort_retention(self):
+        """Cohort x period retention pivot, or None"""
+        return self._table('cohort_retention', lambda: load_cohort_retention(self.data_dir))
+
+    def customer_sketches(self):
+        """Per-cell customer sketches, or None"""
+        return self._table('customer_sketches', lambda: load_customer_sketches(self.data_dir))
+
+    def filter_index(self):
+        """Date and country/segment row index over data()"""
+        return self._table('filter_index', lambda: build_filter_index(self.data()))
+
+    def kpi_prefix_sums(self):
+        """Per-day running KPI totals over the rollup cube"""
+        return self._table('kpi_prefix_sums', lambda: build_kpi_prefix_sums(self.rollups()))
+
+    def _filtered_data(self, filters):
+        """Transactions matching the filters"""
+        return self.data().iloc[filter_rows(self.filter_index(), *filters)]
+
+    def filtered_column(self, filters, col):
+        """On-demand column for the rows matching the filters"""
+        return self.extra_column(col).iloc[filter_rows(self.filter_index(), *filters)]
+
+    def _filtered_rollups(self, filters):
+        """Rollup cube cells matching the filters"""
+        return filter_cube(self.rollups(), *filters)
+
+    def _filtered_sketches(self, filters):
+        """Customer sketch registers of the cells matching the filters"""
+        return filter_cube(self.customer_sketches(), *filters)
+
+    def _group_totals(self, filters, key, measure):
+        """Sum of a measure per value of a key column over the rows matching the filters"""
+        filtered_df = self.filtered_data(filters)
+        return group_totals(filtered_df[key], filtered_df[measure])
+
+def customer_count(source, filters, approximate=False):
+    """Distinct customers matching the filters, exact or estimated from the sketches"""
+    if approximate:
+        return distinct_count(source.filtered_sketches(filters))
+    return source.filtered_data(filters)['CustomerID'].nunique()
+
+def kpi_metrics(source, filters, approximate=False):
+    """Headline KPIs for the metric cards"""
+    # Revenue and orders are two prefix sum lookups; distinct customers are not additive over days
+    totals = range_totals(source.kpi_prefix_sums(), *filters)
+    total_revenue = totals['Revenue']
+    total_orders = int(round(totals['Invoices']))
+    return {
+        'total_revenue': total_revenue,
+        'total_orders': total_orders,
+        'total_customers': customer_count(source, filters, approximate),
+        'avg_order_value': total_revenue / total_orders if total_orders > 0 else float('nan')
+    }
+
+def daily_revenue(source, filters):
+    """Revenue per day as an InvoiceDate/TotalPrice frame"""
+    daily = source.filtered_rollups(filters).groupby('Date', observed=True)['Revenue'].sum().reset_index()
+    daily.columns = ['InvoiceDate', 'TotalPrice']
+    return daily
+
+def daily_revenue_points(source, filters, max_points):
+    """Daily revenue downsampled to about max_points points for line charts"""
+    return downsample(daily_revenue(source, filters), 'InvoiceDate', 'TotalPrice', max_points)
+
+def revenue_forecast(source, filters, horizon=30, max_points=None):
+    """Daily revenue with its linear trend and the trend extended horizon days ahead, or None with 10 days of data or fewer"""
+    daily = daily_revenue(source, filters)
+    if len(daily) <= 10:
+        return None
+    days = (daily['InvoiceDate'] - daily['InvoiceDate'].min()).dt.days
+    trend_line = np.poly1d(np.polyfit(days, daily['TotalPrice'], 1))
+
+    future_days = np.arange(days.max() + 1, days.max() + horizon + 1)
+    forecast = pd.DataFrame({
+        'InvoiceDate': [daily['InvoiceDate'].max() + timedelta(days=int(d - days.max())) for d in future_days],
+        'TotalPrice': trend_line(future_days)
+    })
+
+    # The trend is fitted on every day; only the returned history is downsampled
+    history = daily.assign(Trend=trend_line(days))
+    if max_points is not None:
+        history = downsample(history, 'InvoiceDate', 'TotalPrice', max_points)
+    return {'history': history, 'forecast': forecast}
+
+def monthly_revenue(source, filters):
+    """Revenue per calendar month"""
+    cube = source.filtered_rollups(filters)
+    return cube.groupby(cube['Date'].dt.to_period('M'), observed=True)['Revenue'].sum()
+
+def segment_counts(source, filters):
+    """Transaction lines per customer segment"""
+    cube = source.filtered_rollups(filters)
+    return cube.groupby('CustomerSegment', observed=True)['Lines'].sum().sort_values(ascending=False)
+
+def top_customers(source, filters, n=10):
+    """Customers with the highest revenue"""
+    return top_k(source.group_totals(filters, 'CustomerID', 'TotalPrice'), n)
+
+def top_products(source, filters, measure, n=10):
+    """Products with the highest total of a measure (Quantity or TotalPrice)"""
+    return top_k(source.group_totals(filters, 'Description', measure), n)
+
+def country_revenue(source, filters, n=10):
+    """Countries with the highest revenue"""
+    # Per-country running totals answer any date range without touching the cube cells
+    totals = country_range_totals(source.kpi_prefix_sums(), filters.start_date, filters.end_date, filters.segment)
+    if filters.country != 'All':
+        totals = totals[totals.index == filters.country]
+    return top_k(totals['Revenue'], n)
+
+def country_customers(source, filters, n=10, approximate=False):
+    """Countries with the most distinct customers"""
+    if approximate:
+        sketches = source.filtered_sketches(filters)
+        return top_k(distinct_count(sketches, sketches['Country']), n)
+    filtered_df = source.filtered_data(filters)
+    return top_k(group_distinct(filtered_df['Country'], filtered_df['CustomerID']), n)
+
+def hourly_revenue(source, filters):
+    """Revenue per hour of day"""
+    return source.filtered_rollups(filters).groupby('Hour', observed=True)['Revenue'].sum()
+
+def customer_values(source, filters):
+    """Total revenue per customer"""
+    return source.group_totals(filters, 'CustomerID', 'TotalPrice')
+
+def order_frequency(source, filters):
+    """Number of customers per order count"""
+    order_freq = source.filtered_data(filters).groupby('CustomerID', observed=True)['InvoiceNo'].nunique()
+    return order_freq.value_counts().sort_index()
+
+def monthly_growth(source, filters):
+    """Month-over-month revenue and order growth rates"""
+    cube = source.filtered_rollups(filters)
+    monthly_data = cube.groupby(cube['Date'].dt.to_period('M'), observed=True).agg({
+        'Revenue': 'sum',
+        'Invoices': 'sum'
+    }).reset_index()
+    monthly_data['Month'] = monthly_data['Date'].astype(str)
+
+    # Calculate growth rates
+    monthly_data['Revenue_Growth'] = monthly_data['Revenue'].pct_change() * 100
+    monthly_data['Orders_Growth'] = monthly_data['Invoices'].pct_change() * 100
+    return monthly_data
+
+def segment_performance(source, filters):
+    """Per-segment average revenue, average quantity and line count, normalized to 0-100"""
+    segment_metrics = source.filtered_rollups(filters).groupby('CustomerSegment', observed=True)[['Revenue', 'Quantity', 'Lines']].sum()
+    segment_metrics = pd.DataFrame({
+        'TotalPrice': segment_metrics['Revenue'] / segment_metrics['Lines'],
+        'Quantity': segment_metrics['Quantity'] / segment_metrics['Lines'],
+        'InvoiceNo': segment_metrics['Lines']
+    }).reset_index()
+
+    # Normalize metrics for radar chart
+    for col in ['TotalPrice', 'Quantity', 'InvoiceNo']:
+        segment_metrics[f'{col}_norm'] = (segment_metrics[col] / segment_metrics[col].max()) * 100
+    return segment_metrics
+
+def category_performance(source, filters, cat_col):
+    """Revenue and quantity per product category"""
+    categories = source.filtered_column(filters, cat_col)
+    return source.filtered_data(filters).groupby(categories, observed=True).agg({
+        'TotalPrice': 'sum',
+        'Quantity': 'sum'
+    }).reset_index()
+
+def product_performance(source, filters, n=15):
+    """Revenue, quantity and order count of the top products by revenue"""
+    top_revenue = top_products(source, filters, 'TotalPrice', n)
+
+    # Only the rows of the ranked products are aggregated further
+    filtered_df = source.filtered_data(filters)
+    top_rows = filtered_df[filtered_df['Description'].isin(top_revenue.index)]
+    details = top_rows.groupby('Description', observed=True).agg({
+        'Quantity': 'sum',
+        'InvoiceNo': 'nunique'
+    })
+    return top_revenue.to_frame().join(details).reset_index()
+
+def price_demand(source, filters):
+    """Quantity and revenue per log-spaced unit price bin, excluding free items"""
+    filtered_df = source.filtered_data(filters)
+    return price_demand_bins(filtered_df['UnitPrice'], filtered_df['Quantity'], filtered_df['TotalPrice'])
+
+def weekday_revenue(source, filters):
+    """Revenue per day of week, Monday first"""
+    cube = source.filtered_rollups(filters)
+    weekday_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+    return cube.groupby(cube['Date'].dt.day_name(), observed=True)['Revenue'].sum().reindex(weekday_order)
+
+def order_size_distribution(source, filters):
+    """Number of orders per order value band"""
+    order_sizes = source.filtered_data(filters).groupby('InvoiceNo', observed=True)['TotalPrice'].sum()
+
+    # Create order size categories
+    order_categories = pd.cut(order_sizes,
+                              bins=[0, 50, 100, 250, 500, float('inf')],
+                              labels=['<$50', '$50-100', '$100-250', '$250-500', '$500+'])
+    return order_categories.value_counts()
+
+def business_metrics(source, filters, approximate=False):
+    """Inputs of the advanced business metrics table"""
+    filtered_df = source.filtered_data(filters)
+    cube = source.filtered_rollups(filters)
+
+    total_orders = cube['Invoices'].sum()
+    total_revenue = cube['Revenue'].sum()
+    return {
+        'total_customers': customer_count(source, filters, approximate),
+        'total_orders': total_orders,
+        'total_revenue': total_revenue,
+        'avg_order_value': total_revenue / total_orders if total_orders > 0 else 0,
+        'avg_orders_per_customer': filtered_df.groupby('CustomerID', observed=True)['InvoiceNo'].nunique().mean(),
+        'days': (filtered_df['InvoiceDate'].max() - filtered_df['InvoiceDate'].min()).days,
+        'countries': len(filtered_df['Country'].unique())
+    }
+
+def weekday_hour_revenue(source, filters):
+    """Revenue pivot of day of week against hour of day"""
+    cube = source.filtered_rollups(filters)
+    hourly_heatmap = cube.groupby([cube['Date'].dt.day_name().rename('Weekday'), 'Hour'], observed=True)['Revenue'].sum().reset_index()
+    return hourly_heatmap.pivot(index='Weekday', columns='Hour', values='Revenue')
+
+def quarterly_performance(source, filters):
+    """Revenue and orders per quarter"""
+    cube = source.filtered_rollups(filters)
+    quarterly_data = cube.groupby(cube['Date'].dt.quarter, observed=True).agg({
+        'Revenue': 'sum',
+        'Invoices': 'sum'
+    }).reset_index()
+    quarterly_data['Quarter'] = 'Q' + quarterly_data['Date'].astype(str)
+    return quarterly_data
+
+def customer_acquisition(source, filters):
+    """New customers per month of first purchase"""
+    filtered_df = source.filtered_data(filters)
+    if 'FirstPurchaseDate' in source.available_columns():
+        first_purchase = pd.to_datetime(source.filtered_column(filters, 'FirstPurchaseDate'))
+        return filtered_df.groupby(first_purchase.dt.to_period('M'), observed=True)['CustomerID'].nunique()
+
+    # Alternative: first purchase per customer
+    first_purchases = filtered_df.groupby('CustomerID', observed=True)['InvoiceDate'].min()
+    return first_purchases.dt.to_period('M').value_counts().sort_index()
+
+def monthly_active_customers(source, filters, approximate=False):
+    """Distinct customers per month"""
+    if approximate:
+        sketches = source.filtered_sketches(filters)
+        return distinct_count(sketches, sketches['Date'].dt.to_period('M'))
+    filtered_df = source.filtered_data(filters)
+    return filtered_df.groupby(filtered_df['InvoiceDate'].dt.to_period('M'), observed=True)['CustomerID'].nunique()
+
+def churn_distribution(source, filters):
+    """Customers per churn risk band"""
+    filtered_df = source.filtered_data(filters)
+    customer_metrics = filtered_df.groupby('CustomerID', observed=True).agg({
+        'InvoiceDate': ['min', 'max', 'count'],
+        'TotalPrice': ['sum', 'mean'],
+        'InvoiceNo': 'nunique'
+    }).reset_index()
+
+    customer_metrics.columns = ['CustomerID', 'FirstPurchase', 'LastPurchase', 'TotalOrders',
+                                'TotalSpent', 'AvgOrderValue', 'UniqueOrders']
+
+    # Days since last purchase
+    customer_metrics['DaysSinceLastPurchase'] = (filtered_df['InvoiceDate'].max() - customer_metrics['LastPurchase']).dt.days
+
+    # Churn risk scoring
+    customer_metrics['ChurnRisk'] = pd.cut(customer_metrics['DaysSinceLastPurchase'],
+                                           bins=[0, 30, 90, 180, float('inf')],
+                                           labels=['Low', 'Medium', 'High', 'Critical'])
+
+    return customer_metrics['ChurnRisk'].value_counts()
+
+def customer_activity(source, filters, n=10):
+    """Customers with the most transaction lines"""
+    # CustomerID is categorical, so value_counts() also lists customers without lines in the slice
+    line_counts = source.filtered_data(filters)['CustomerID'].value_counts()
+    return line_counts[line_counts > 0].head(n)
+
+def product_demand_trend(source, filters, n=5):
+    """Monthly quantity of the top products by quantity"""
+    # Shares its per-product quantity totals with the top products chart
+    top_product_names = top_products(source, filters, 'Quantity', n).index
+    filtered_df = source.filtered_data(filters)
+    filtered_df = filtered_df[filtered_df['Description'].isin(top_product_names)]
+    product_trend = filtered_df.groupby(['Description', filtered_df['InvoiceDate'].dt.to_period('M')], observed=True)['Quantity'].sum().reset_index()
+    return {product: product_trend[product_trend['Description'] == product] for product in top_product_names}
+
+def market_opportunity(source, filters, approximate=False):
+    """Per-country revenue, customers, orders and revenue per customer"""
+    if approximate:
+        # Revenue and orders are additive over the rollup cells; customers come from the sketches
+        sketches = source.filtered_sketches(filters)
+        country_metrics = source.filtered_rollups(filters).groupby('Country', observed=True).agg(
+            TotalPrice=('Revenue', 'sum'),
+            InvoiceNo=('Invoices', 'sum')
+        )
+        country_metrics['CustomerID'] = distinct_count(sketches, sketches['Country'])
+        country_metrics = country_metrics[['TotalPrice', 'CustomerID', 'InvoiceNo']].reset_index()
+    else:
+        country_metrics = source.filtered_data(filters).groupby('Country', observed=True).agg({
+            'TotalPrice': 'sum',
+            'CustomerID': 'nunique',
+            'InvoiceNo': 'nunique'
+        }).reset_index()
+
+    country_metrics['AvgRevenuePerCustomer'] = country_metrics['TotalPrice'] / country_metrics['CustomerID']
+    return country_metrics
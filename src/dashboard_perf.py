@@ -0,0 +1,151 @@
+# Per-rerun timing of dashboard aggregations and charts, with cache hit/miss counts
+import pandas as pd
+import numpy as np
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from functools import wraps
+from profiling import REPORT_DIR
+
+# One JSON line per instrumented rerun
+PERF_LOG = os.path.join(REPORT_DIR, 'dashboard_perf.jsonl')
+
+class RerunRecorder:
+    """Collects the timings and cache hit/miss counts of the current script rerun"""
+
+    def __init__(self):
+        # Streamlit runs each session's script on its own thread, so each
+        # session records into its own run
+        self._local = threading.local()
+
+    @property
+    def run(self):
+        return getattr(self._local, 'run', None)
+
+    def start(self):
+        """Begin recording the current rerun"""
+        self._local.run = {'started': time.time(), 'clock': time.perf_counter(), 'timings': [], 'cache': {}}
+
+    def stop(self):
+        """Stop recording and return the finished rerun record, or None if nothing was recorded"""
+        run = self.run
+        self._local.run = None
+        if run is None:
+            return None
+        return {
+            'time': pd.Timestamp(run['started'], unit='s').isoformat(),
+            'rerun_ms': round((time.perf_counter() - run['clock']) * 1000, 2),
+            'timings': run['timings'],
+            'cache': run['cache']
+        }
+
+    def timer(self, kind, name):
+        """Context manager recording the duration of a block while a rerun is being recorded"""
+        return _Timer(self, kind, name)
+
+    def record(self, kind, name, seconds):
+        if self.run is not None:
+            self.run['timings'].append({'kind': kind, 'name': name, 'ms': round(seconds * 1000, 2)})
+
+    def count(self, name, miss=False):
+        if self.run is not None:
+            counts = self.run['cache'].setdefault(name, {'calls': 0, 'misses': 0})
+            counts['misses' if miss else 'calls'] += 1
+
+    def cached(self, cache):
+        """Wrap a function in a Streamlit cache decorator, timing each call and counting cache misses"""
+        def decorate(func):
+            name = func.__name__
+
+            # Only runs when the cache has no entry for the arguments
+            @wraps(func)
+            def compute(*args, **kwargs):
+                self.count(name, miss=True)
+                return func(*args, **kwargs)
+            cached_func = cache(compute)
+
+            @wraps(func)
+            def call(*args, **kwargs):
+                if self.run is None:
+                    return cached_func(*args, **kwargs)
+                self.count(name)
+                with self.timer('data', name):
+                    return cached_func(*args, **kwargs)
+            call.clear = cached_func.clear
+            return call
+        return decorate
+
+class _Timer:
+    def __init__(self, recorder, kind, name):
+        self.recorder, self.kind, self.name = recorder, kind, name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.recorder.record(self.kind, self.name, time.perf_counter() - self.start)
+        return False
+
+# Process-wide recorder shared by the dashboard
+PERF = RerunRecorder()
+
+def timing_table(rerun):
+    """Timings of one rerun, slowest first"""
+    timings = pd.DataFrame(rerun['timings'], columns=['kind', 'name', 'ms'])
+    return timings.sort_values('ms', ascending=False, kind='stable').reset_index(drop=True)
+
+def cache_table(rerun):
+    """Calls, hits and misses of each cached function in one rerun"""
+    cache = pd.DataFrame.from_dict(rerun['cache'], orient='index', columns=['calls', 'misses'])
+    cache.index.name = 'function'
+    cache['hits'] = cache['calls'] - cache['misses']
+    return cache[['calls', 'hits', 'misses']].sort_values('misses', ascending=False, kind='stable')
+
+def append_log(rerun, path=PERF_LOG):
+    """Append a rerun record to the JSON-lines performance log"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(rerun) + '\n')
+
+def read_log(path=PERF_LOG, last=None):
+    """Rerun records from the performance log, optionally only the most recent ones"""
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        # Only the window is kept in memory, however long the log has grown
+        lines = deque(f, maxlen=last)
+    return [json.loads(line) for line in lines if line.strip()]
+
+def latency_percentiles(reruns):
+    """p50/p95 latency in ms of whole reruns and of each timed aggregation and chart"""
+    if not reruns:
+        return pd.DataFrame(columns=['kind', 'name', 'samples', 'p50_ms', 'p95_ms'])
+
+    rows = [{'kind': 'rerun', 'name': 'total', 'ms': rerun['rerun_ms']} for rerun in reruns]
+    for rerun in reruns:
+        # Names timed several times in one rerun count once, with their total
+        totals = {}
+        for timing in rerun['timings']:
+            key = (timing['kind'], timing['name'])
+            totals[key] = totals.get(key, 0.0) + timing['ms']
+        rows += [{'kind': kind, 'name': name, 'ms': ms} for (kind, name), ms in totals.items()]
+
+    samples = pd.DataFrame(rows)
+    grouped = samples.groupby(['kind', 'name'], sort=False)['ms']
+    summary = pd.DataFrame({
+        'samples': grouped.size(),
+        'p50_ms': grouped.quantile(0.5),
+        'p95_ms': grouped.quantile(0.95)
+    }).round(2).reset_index()
+    # Whole-rerun row first, then slowest p95 first
+    order = np.lexsort((-summary['p95_ms'].to_numpy(), summary['kind'] != 'rerun'))
+    return summary.iloc[order].reset_index(drop=True)
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else PERF_LOG
+    reruns = read_log(path)
+    print(f"{len(reruns)} reruns in '{path}'")
+    print(latency_percentiles(reruns).to_string(index=False))
@@ -0,0 +1,334 @@
+# Storage helpers for the Online Retail feature tables
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datetime import datetime
+import json
+import os
+import shutil
+
+# Get the correct paths relative to the project root
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SRC_DIR)
+# RETAIL_DATA_DIR points the pipeline and dashboard at another data directory
+DATA_DIR = os.environ.get('RETAIL_DATA_DIR', os.path.join(PROJECT_ROOT, 'data'))
+
+# Supported storage formats, in load preference order
+STORAGE_FORMATS = ['parquet', 'csv']
+DEFAULT_FORMAT = 'parquet'
+
+# Column typing applied before writing a table
+DATETIME_COLUMNS = ['InvoiceDate', 'FirstPurchase', 'LastPurchase', 'Date']
+STRING_COLUMNS = ['InvoiceNo', 'StockCode', 'CustomerID', 'Description']
+CATEGORY_COLUMNS = [
+    'Country', 'DayName', 'Season', 'QuantityCategory', 'PriceCategory',
+    'TransactionSize', 'CustomerSegment', 'ProductCategory'
+]
+INT_COLUMNS = [
+    'Year', 'Month', 'Day', 'DayOfWeek', 'Hour', 'Quarter', 'WeekOfYear',
+    'IsWeekend', 'IsBusinessHour', 'IsHolidaySeason', 'IsCanceled',
+    'RecencyScore', 'FrequencyScore', 'MonetaryScore'
+]
+
+# Compact in-memory schema: repeated strings become categoricals, 0/1 flags
+# become bools and the remaining numbers take the smallest lossless type
+COMPACT_CATEGORY_COLUMNS = CATEGORY_COLUMNS + ['InvoiceNo', 'StockCode', 'CustomerID', 'Description', 'RFM_Score']
+FLAG_COLUMNS = ['IsWeekend', 'IsBusinessHour', 'IsHolidaySeason', 'IsCanceled']
+SMALL_INT_COLUMNS = [
+    'Year', 'Month', 'Day', 'DayOfWeek', 'Hour', 'Quarter', 'WeekOfYear',
+    'RecencyScore', 'FrequencyScore', 'MonetaryScore'
+]
+
+# Background refreshes publish each run as a versioned snapshot directory
+# under data/snapshots; current.json points readers at the one being served.
+# Without the pointer, the tables directly in the data directory are served
+SNAPSHOT_DIR = 'snapshots'
+CURRENT_POINTER = 'current.json'
+STAGING_PREFIX = '.staging_'
+# Older snapshots stay readable for a while for sessions still holding them
+KEEP_SNAPSHOTS = 3
+
+def table_path(name, fmt=DEFAULT_FORMAT, data_dir=DATA_DIR):
+    """Return the file path of a feature table in the given format"""
+    if fmt not in STORAGE_FORMATS:
+        raise ValueError(f"Unsupported storage format: {fmt}")
+    return os.path.join(data_dir, f"{name}.{fmt}")
+
+def find_table(name, data_dir=None):
+    """Return (path, format) of the first stored copy of a table, or (None, None)"""
+    if data_dir is None:
+        data_dir = current_data_source()[1]
+    for fmt in STORAGE_FORMATS:
+        path = table_path(name, fmt, data_dir)
+        if os.path.exists(path):
+            return path, fmt
+    return None, None
+
+def prepare_for_storage(df):
+    """Apply the typed storage schema to a feature table"""
+    df = df.copy()
+
+    for col in df.columns:
+        if col in DATETIME_COLUMNS:
+            df[col] = pd.to_datetime(df[col])
+        elif col in STRING_COLUMNS:
+            # Identifiers come out of read_csv as a mix of ints, floats and strings
+            df[col] = df[col].astype(str)
+        elif col in CATEGORY_COLUMNS:
+            df[col] = df[col].astype('category')
+        elif col in INT_COLUMNS:
+            df[col] = df[col].astype('int64')
+        elif isinstance(df[col].dtype, pd.PeriodDtype):
+            # Parquet has no native period type; keep the CSV 'YYYY-MM' form
+            df[col] = df[col].astype(str)
+
+    return compact_dtypes(df)
+
+def _downcast(series):
+    """Downcast a numeric column to the smallest type that is safe for the dashboard arithmetic"""
+    if series.name in SMALL_INT_COLUMNS and not series.hasnans:
+        return pd.to_numeric(series, downcast='integer')
+
+    if pd.api.types.is_integer_dtype(series.dtype) and not series.hasnans:
+        # Group sums of small ints come back in the input type, so measures
+        # never go below int32
+        narrow = pd.to_numeric(series, downcast='integer')
+        return narrow if narrow.dtype.itemsize >= 4 else narrow.astype('int32')
+
+    if pd.api.types.is_float_dtype(series.dtype):
+        values = series.to_numpy()
+        # Prices and revenue are not exact in float32; only downcast when lossless
+        narrow = values.astype(np.float32)
+        if np.array_equal(narrow.astype(values.dtype), values, equal_nan=True):
+            return pd.Series(narrow, index=series.index, name=series.name)
+
+    return series
+
+def compact_dtypes(df, report=False):
+    """Convert a feature table to the compact in-memory schema, optionally printing the memory saved"""
+    before = df.memory_usage(deep=True) if report else None
+    df = df.copy()
+
+    for col in df.columns:
+        dtype = df[col].dtype
+        if col in COMPACT_CATEGORY_COLUMNS:
+            # Keys that are unique per row (e.g. CustomerID in customer_features) stay strings
+            if not isinstance(dtype, pd.CategoricalDtype) and df[col].nunique() <= len(df) // 2:
+                df[col] = df[col].astype('category')
+        elif col in FLAG_COLUMNS:
+            df[col] = df[col].astype(bool)
+        elif pd.api.types.is_bool_dtype(dtype) or isinstance(dtype, pd.CategoricalDtype):
+            continue
+        elif pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_datetime64_any_dtype(dtype):
+            df[col] = _downcast(df[col])
+
+    if report:
+        print_memory_report(before, df.memory_usage(deep=True), df.dtypes)
+
+    return df
+
+def print_memory_report(before, after, dtypes):
+    """Print per-column memory before and after compaction"""
+    mb = 1024 ** 2
+    print(f"{'Column':<26}{'Type':<16}{'Before (MB)':>14}{'After (MB)':>14}")
+    for col in after.index:
+        dtype = str(dtypes[col]) if col in dtypes.index else ''
+        print(f"{col:<26}{dtype:<16}{before[col] / mb:>14.2f}{after[col] / mb:>14.2f}")
+    print(f"{'Total':<42}{before.sum() / mb:>14.2f}{after.sum() / mb:>14.2f}")
+
+def save_table(df, name, fmt=DEFAULT_FORMAT, data_dir=DATA_DIR):
+    """Save a feature table in the given storage format and return its path"""
+    path = table_path(name, fmt, data_dir)
+
+    if fmt == 'parquet':
+        prepare_for_storage(df).to_parquet(path, index=False, engine='pyarrow', compression='snappy')
+    else:
+        df.to_csv(path, index=False)
+
+    return path
+
+def _stream_frame(df):
+    """Type a chunk so every chunk of a table maps to the same Arrow schema"""
+    df = prepare_for_storage(df)
+
+    for col in df.columns:
+        dtype = df[col].dtype
+        if isinstance(dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(dtype):
+            continue
+        if col in COMPACT_CATEGORY_COLUMNS:
+            # Per-chunk cardinality must not decide between string and category
+            df[col] = df[col].astype('category')
+        elif pd.api.types.is_integer_dtype(dtype):
+            df[col] = df[col].astype('int64')
+        elif pd.api.types.is_float_dtype(dtype):
+            df[col] = df[col].astype('float64')
+
+    return df
+
+def _stream_schema(schema):
+    """Widen dictionary indices so later chunks with more categories still fit"""
+    fields = [pa.field(field.name, pa.dictionary(pa.int32(), field.type.value_type))
+              if pa.types.is_dictionary(field.type) else field for field in schema]
+    return pa.schema(fields, metadata=schema.metadata)
+
+class TableWriter:
+    """Write a feature table chunk by chunk without holding it in memory"""
+
+    def __init__(self, name, fmt=DEFAULT_FORMAT, data_dir=DATA_DIR):
+        self.path = table_path(name, fmt, data_dir)
+        self.fmt = fmt
+        self.rows = 0
+        self.columns = []
+        self._schema = None
+        self._writer = None
+
+    def write(self, df):
+        """Append a chunk; the first chunk fixes the columns and types"""
+        if self.fmt == 'parquet':
+            table = pa.Table.from_pandas(_stream_frame(df), preserve_index=False)
+            if self._writer is None:
+                self._schema = _stream_schema(table.schema)
+                self._writer = pq.ParquetWriter(self.path, self._schema, compression='snappy')
+            self._writer.write_table(table.cast(self._schema))
+        else:
+            first = self.rows == 0
+            df.to_csv(self.path, mode='w' if first else 'a', header=first, index=False)
+
+        self.rows += len(df)
+        self.columns = list(df.columns)
+
+    def close(self):
+        """Finish the file"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def table_columns(name, data_dir=None):
+    """Return the column names of a stored table without loading any rows"""
+    if data_dir is None:
+        data_dir = current_data_source()[1]
+    path, fmt = find_table(name, data_dir)
+    if path is None:
+        raise FileNotFoundError(f"No stored copy of '{name}' found in {data_dir}")
+
+    if fmt == 'parquet':
+        return list(pq.read_schema(path).names)
+    return list(pd.read_csv(path, nrows=0).columns)
+
+def load_table(name, columns=None, data_dir=None):
+    """Load a feature table, preferring the columnar copy and reading only the requested columns"""
+    if data_dir is None:
+        data_dir = current_data_source()[1]
+    path, fmt = find_table(name, data_dir)
+    if path is None:
+        raise FileNotFoundError(f"No stored copy of '{name}' found in {data_dir}")
+
+    if fmt == 'parquet':
+        if columns is not None:
+            # Only project columns the file actually has
+            available = set(pq.read_schema(path).names)
+            columns = [col for col in columns if col in available]
+        return pd.read_parquet(path, engine='pyarrow', columns=columns)
+
+    usecols = None if columns is None else (lambda col: col in columns)
+    # Identifiers are stored as strings; read them back as strings, as the Parquet schema does,
+    # so all-numeric StockCodes and InvoiceNos still match the keys of the other tables
+    df = pd.read_csv(path, usecols=usecols, low_memory=False, dtype={col: str for col in STRING_COLUMNS})
+    for col in DATETIME_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col])
+    return df
+
+def shared_table_path(name, data_dir=DATA_DIR):
+    """Return the path of the memory-mappable Arrow IPC copy of a table"""
+    return os.path.join(data_dir, f"{name}.arrow")
+
+def write_shared_table(df, path):
+    """Write a frame as an uncompressed Arrow IPC file, replacing any previous copy atomically"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Processes that mapped the old file keep reading it until they remap
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+    return path
+
+def map_shared_table(path):
+    """Memory-map an Arrow IPC file as a frame whose numeric and datetime columns are read-only views of the file"""
+    # The mapping stays open for as long as a column still references it
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    return table.to_pandas(split_blocks=True)
+
+def read_current_pointer(data_dir=DATA_DIR):
+    """Return the manifest of the published snapshot, or None when no snapshot is published"""
+    try:
+        with open(os.path.join(data_dir, CURRENT_POINTER)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def current_data_source(data_dir=DATA_DIR):
+    """Return (version, directory) of the tables being served from a data directory"""
+    manifest = read_current_pointer(data_dir)
+    if manifest is None:
+        return None, data_dir
+    return manifest['version'], os.path.join(data_dir, manifest['path'])
+
+def begin_snapshot(data_dir=DATA_DIR):
+    """Create the staging directory a new snapshot is written to and return its path"""
+    version = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    staging = os.path.join(data_dir, SNAPSHOT_DIR, STAGING_PREFIX + version)
+    os.makedirs(staging)
+    return staging
+
+def discard_snapshot(staging):
+    """Delete an unpublished staging directory"""
+    shutil.rmtree(staging, ignore_errors=True)
+
+def publish_snapshot(staging, data_dir=DATA_DIR, keep=KEEP_SNAPSHOTS):
+    """Move a finished staging directory into place, point readers at it and return its manifest"""
+    version = os.path.basename(staging)[len(STAGING_PREFIX):]
+    path = os.path.join(data_dir, SNAPSHOT_DIR, version)
+    os.replace(staging, path)
+
+    manifest = {
+        'version': version,
+        'path': os.path.relpath(path, data_dir),
+        'published_at': datetime.now().isoformat(timespec='seconds'),
+        'tables': sorted(os.listdir(path))
+    }
+    # Readers see either the old or the new pointer, never a partial one
+    pointer = os.path.join(data_dir, CURRENT_POINTER)
+    with open(pointer + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer + '.tmp', pointer)
+
+    prune_snapshots(data_dir, keep)
+    return manifest
+
+def release_snapshot(data_dir=DATA_DIR):
+    """Serve the tables directly in the data directory again; returns whether a snapshot was published"""
+    try:
+        os.remove(os.path.join(data_dir, CURRENT_POINTER))
+        return True
+    except FileNotFoundError:
+        return False
+
+def prune_snapshots(data_dir=DATA_DIR, keep=KEEP_SNAPSHOTS):
+    """Delete all but the newest published snapshots; the served one is always kept"""
+    root = os.path.join(data_dir, SNAPSHOT_DIR)
+    current = current_data_source(data_dir)[0]
+    versions = sorted(name for name in os.listdir(root) if not name.startswith(STAGING_PREFIX))
+    for version in versions[:-keep] if keep > 0 else versions:
+        if version != current:
+            shutil.rmtree(os.path.join(root, version), ignore_errors=True)
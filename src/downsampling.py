@@ -0,0 +1,68 @@
+# Server-side downsampling of long time series before they are sent to the browser
+import numpy as np
+
+# Downsampling methods by name
+METHODS = ['lttb', 'minmax']
+
+def lttb_indices(x, y, n_out):
+    """Row positions kept by Largest-Triangle-Three-Buckets downsampling to n_out points"""
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # The first and last points are always kept; the interior is split into
+    # n_out - 2 buckets that each contribute the point forming the largest
+    # triangle with the previous pick and the mean of the next bucket
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    kept = np.empty(n_out, dtype=np.intp)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i < n_out - 3:
+            next_x, next_y = x[hi:edges[i + 2]].mean(), y[hi:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+        area = np.abs((x[previous] - next_x) * (y[lo:hi] - y[previous])
+                      - (x[previous] - x[lo:hi]) * (next_y - y[previous]))
+        previous = lo + int(np.argmax(area))
+        kept[i + 1] = previous
+    return kept
+
+def minmax_indices(y, n_out):
+    """Row positions of the minimum and maximum of each of n_out / 2 equal-width buckets"""
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+    y = np.asarray(y, dtype=np.float64)
+
+    starts = np.linspace(0, n, n_out // 2 + 1).astype(np.intp)[:-1]
+    bucket = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, n)))
+    kept = [[0, n - 1]]
+    for extreme in (np.minimum, np.maximum):
+        hits = np.flatnonzero(y == extreme.reduceat(y, starts)[bucket])
+        # First row reaching the extreme in each bucket
+        _, first = np.unique(bucket[hits], return_index=True)
+        kept.append(hits[first])
+    return np.unique(np.concatenate(kept))
+
+def downsample(df, x, y, n_out, method='lttb'):
+    """Rows of a frame sorted by x reduced to about n_out points that keep the shape of y"""
+    if len(df) <= n_out:
+        return df
+    if method == 'lttb':
+        xs = df[x].to_numpy()
+        if np.issubdtype(xs.dtype, np.datetime64):
+            xs = xs.view('i8')
+        kept = lttb_indices(xs, df[y].to_numpy(), n_out)
+    elif method == 'minmax':
+        kept = minmax_indices(df[y].to_numpy(), n_out)
+    else:
+        raise ValueError(f"Unknown downsampling method '{method}', expected one of {METHODS}")
+    return df.iloc[kept]
+
+def target_points(width_px, points_per_px=1.0, minimum=100):
+    """Number of points worth drawing on a chart of the given plot width"""
+    return max(int(width_px * points_per_px), minimum)
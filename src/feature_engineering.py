@@ -1,22 +1,32 @@
 # Feature Engineering for Online Retail Dataset
 import pandas as pd
 import numpy as np
-from datetime import datetime
-from operator import attrgetter
+import argparse
 import os
 import warnings
+from data_store import (DATA_DIR, DEFAULT_FORMAT, STORAGE_FORMATS, STRING_COLUMNS, FLAG_COLUMNS,
+                        TableWriter, load_table, save_table, begin_snapshot, discard_snapshot,
+                        publish_snapshot, release_snapshot)
+from rollups import build_rollup_cube, combine_cubes, cohort_activity, build_cohort_retention
+from sketches import build_customer_sketches, combine_sketches
+from segmentation import DEFAULT_SEGMENT_RULES, assign_segments, load_segment_rules
+from aggregation import aggregate_entities, customer_base_features, product_base_features, country_base_features
+from incremental import merge_states, save_states, load_states
+from parallel import resolve_jobs, map_blocks, parallel_aggregate
+from profiling import PROFILER, pipeline_stage
 warnings.filterwarnings('ignore')
 
-def load_and_prepare_data():
-    """Load and prepare the cleaned dataset"""
+# Cleaned source data and the default chunk size of the streaming mode
+SOURCE_PATH = os.path.join(DATA_DIR, 'Online_Retail_Cleaned.csv')
+DEFAULT_CHUNKSIZE = 100000
+
+@pipeline_stage
+def load_and_prepare_data(skip_rows=0):
+    """Load and prepare the cleaned dataset, optionally skipping rows already ingested"""
     print("Loading cleaned dataset...")
     
-    # Get the correct path to the data file
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(script_dir)
-    data_path = os.path.join(project_root, 'data', 'Online_Retail_Cleaned.csv')
-    
-    df = pd.read_csv(data_path)
+    # Skip data rows only; line 0 is the header
+    df = pd.read_csv(SOURCE_PATH, skiprows=range(1, skip_rows + 1))
     
     # Convert InvoiceDate to datetime
     df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
@@ -27,6 +37,7 @@ def load_and_prepare_data():
     print(f"Dataset loaded with {len(df)} records")
     return df
 
+@pipeline_stage
 def create_time_features(df):
     """Create time-based features"""
     print("Creating time-based features...")
@@ -56,6 +67,7 @@ def create_time_features(df):
     
     return df
 
+@pipeline_stage
 def create_transaction_features(df):
     """Create transaction-level features"""
     print("Creating transaction features...")
@@ -84,37 +96,34 @@ def create_transaction_features(df):
     
     return df
 
-def create_customer_features(df):
-    """Create customer-level features"""
-    print("Creating customer features...")
+@pipeline_stage
+def create_entity_features(df, segment_rules=DEFAULT_SEGMENT_RULES):
+    """Create customer, product and country features from one aggregation pass"""
+    print("Creating customer, product and country features...")
     
-    # Handle missing CustomerIDs
+    # Handle missing CustomerIDs and descriptions
     df['CustomerID'] = df['CustomerID'].fillna('UNKNOWN_CUSTOMER')
+    df['Description'] = df['Description'].fillna('UNKNOWN_DESCRIPTION')
     
     # Latest date for recency calculation
     latest_date = df['InvoiceDate'].max()
     
-    # Customer aggregations
-    customer_features = df.groupby('CustomerID').agg({
-        'InvoiceDate': ['min', 'max', 'count'],
-        'InvoiceNo': 'nunique',
-        'Revenue': ['sum', 'mean', 'std'],
-        'Quantity': ['sum', 'mean'],
-        'UnitPrice': 'mean',
-        'Country': 'first'
-    }).round(2)
-    
-    # Flatten column names
-    customer_features.columns = ['_'.join(col).strip() for col in customer_features.columns]
-    customer_features = customer_features.reset_index()
-    
-    # Rename columns for clarity
-    customer_features.columns = [
-        'CustomerID', 'FirstPurchase', 'LastPurchase', 'TotalTransactions',
-        'UniqueInvoices', 'TotalRevenue', 'AvgRevenue', 'StdRevenue',
-        'TotalQuantity', 'AvgQuantity', 'AvgUnitPrice', 'Country'
-    ]
+    # All entity and basket aggregates over factorized keys
+    aggregates = aggregate_entities(df)
     
+    customer_features, product_features, country_features = features_from_states(aggregates, latest_date, segment_rules)
+    
+    return customer_features, product_features, country_features, aggregates
+
+def features_from_states(states, latest_date, segment_rules=DEFAULT_SEGMENT_RULES):
+    """Derive the customer, product and country feature tables from aggregated states"""
+    customer_features = add_customer_scores(customer_base_features(states['customer']), latest_date, segment_rules)
+    product_features = add_product_metrics(product_base_features(states['product'], states['pairs']))
+    country_features = add_country_metrics(country_base_features(states['country'], states['pairs']))
+    return customer_features, product_features, country_features
+
+def add_customer_scores(customer_features, latest_date, segment_rules=DEFAULT_SEGMENT_RULES):
+    """Add lifespan, RFM scores and segments to aggregated customer features"""
     # Calculate additional customer metrics
     customer_features['CustomerLifespan'] = (customer_features['LastPurchase'] - customer_features['FirstPurchase']).dt.days
     customer_features['Recency'] = (latest_date - customer_features['LastPurchase']).dt.days
@@ -131,53 +140,16 @@ def create_customer_features(df):
                                      customer_features['FrequencyScore'].astype(str) + 
                                      customer_features['MonetaryScore'].astype(str))
     
-    # Customer segments
-    def categorize_customer(row):
-        if row['RecencyScore'] >= 4 and row['FrequencyScore'] >= 4 and row['MonetaryScore'] >= 4:
-            return 'Champions'
-        elif row['RecencyScore'] >= 3 and row['FrequencyScore'] >= 3 and row['MonetaryScore'] >= 3:
-            return 'Loyal Customers'
-        elif row['RecencyScore'] >= 4 and row['FrequencyScore'] <= 2:
-            return 'New Customers'
-        elif row['RecencyScore'] <= 2 and row['FrequencyScore'] >= 3:
-            return 'At Risk'
-        elif row['RecencyScore'] <= 2 and row['FrequencyScore'] <= 2:
-            return 'Lost Customers'
-        else:
-            return 'Potential Loyalists'
-    
-    customer_features['CustomerSegment'] = customer_features.apply(categorize_customer, axis=1)
+    # Customer segments, looked up from the integer scores
+    customer_features['CustomerSegment'] = assign_segments(customer_features['RecencyScore'].astype(int),
+                                                           customer_features['FrequencyScore'].astype(int),
+                                                           customer_features['MonetaryScore'].astype(int),
+                                                           segment_rules)
     
     return customer_features
 
-def create_product_features(df):
-    """Create product-level features"""
-    print("Creating product features...")
-    
-    # Handle missing descriptions
-    df['Description'] = df['Description'].fillna('UNKNOWN_DESCRIPTION')
-    
-    # Product aggregations
-    product_features = df.groupby('StockCode').agg({
-        'Description': 'first',
-        'UnitPrice': ['mean', 'std', 'min', 'max'],
-        'Quantity': ['sum', 'mean', 'count'],
-        'Revenue': ['sum', 'mean'],
-        'CustomerID': 'nunique',
-        'Country': 'nunique'
-    }).round(2)
-    
-    # Flatten column names
-    product_features.columns = ['_'.join(col).strip() for col in product_features.columns]
-    product_features = product_features.reset_index()
-    
-    # Rename columns
-    product_features.columns = [
-        'StockCode', 'Description', 'AvgPrice', 'PriceStd', 'MinPrice', 'MaxPrice',
-        'TotalQuantitySold', 'AvgQuantityPerOrder', 'TotalOrders',
-        'TotalRevenue', 'AvgRevenuePerOrder', 'UniqueCustomers', 'CountriesServed'
-    ]
-    
+def add_product_metrics(product_features):
+    """Add variability, popularity and performance category to aggregated product features"""
     # Calculate additional product metrics
     product_features['PriceVariability'] = product_features['PriceStd'] / product_features['AvgPrice']
     product_features['PopularityScore'] = product_features['TotalOrders'] / product_features['TotalOrders'].max()
@@ -190,28 +162,8 @@ def create_product_features(df):
     
     return product_features
 
-def create_country_features(df):
-    """Create country-level features"""
-    print("Creating country features...")
-    
-    country_features = df.groupby('Country').agg({
-        'Revenue': ['sum', 'mean', 'count'],
-        'CustomerID': 'nunique',
-        'StockCode': 'nunique',
-        'Quantity': ['sum', 'mean'],
-        'UnitPrice': 'mean'
-    }).round(2)
-    
-    # Flatten column names
-    country_features.columns = ['_'.join(col).strip() for col in country_features.columns]
-    country_features = country_features.reset_index()
-    
-    # Rename columns
-    country_features.columns = [
-        'Country', 'TotalRevenue', 'AvgRevenue', 'TotalTransactions',
-        'UniqueCustomers', 'UniqueProducts', 'TotalQuantity', 'AvgQuantity', 'AvgUnitPrice'
-    ]
-    
+def add_country_metrics(country_features):
+    """Add market share and per-customer ratios to aggregated country features"""
     # Calculate market share
     country_features['MarketShare'] = country_features['TotalRevenue'] / country_features['TotalRevenue'].sum()
     country_features['RevenuePerCustomer'] = country_features['TotalRevenue'] / country_features['UniqueCustomers']
@@ -219,83 +171,122 @@ def create_country_features(df):
     
     return country_features
 
+def gather_features(df, key, table, columns, suffix=''):
+    """Add table columns to df in place by key, gathering table rows by position instead of joining"""
+    # Hash only the distinct keys, then map every row through its integer key code
+    codes, uniques = pd.factorize(df[key])
+    positions = table.index.get_indexer(uniques)
+    rows = np.where(codes >= 0, positions[codes] if len(positions) else -1, -1)
+    
+    for col in columns:
+        # Same naming as a left merge with suffixes=('', suffix)
+        name = col + suffix if col in df.columns else col
+        values = table[col].to_numpy() if isinstance(table[col].dtype, np.dtype) else table[col].array
+        df[name] = pd.api.extensions.take(values, rows, allow_fill=True)
+    
+    return df
+
+@pipeline_stage
 def merge_all_features(df, customer_features, product_features, country_features):
     """Merge all features back to main dataset"""
     print("Merging all features...")
     
     # Merge customer features
-    df = df.merge(customer_features[['CustomerID', 'CustomerSegment', 'RecencyScore', 'FrequencyScore', 
-                                   'MonetaryScore', 'RFM_Score', 'TotalRevenue', 'Frequency', 'Recency']], 
-                 on='CustomerID', how='left', suffixes=('', '_customer'))
+    df = gather_features(df, 'CustomerID', customer_features.set_index('CustomerID'),
+                         ['CustomerSegment', 'RecencyScore', 'FrequencyScore', 'MonetaryScore',
+                          'RFM_Score', 'TotalRevenue', 'Frequency', 'Recency'], '_customer')
     
     # Merge product features
-    df = df.merge(product_features[['StockCode', 'ProductCategory', 'PopularityScore', 
-                                   'TotalRevenue', 'UniqueCustomers']], 
-                 on='StockCode', how='left', suffixes=('', '_product'))
+    df = gather_features(df, 'StockCode', product_features.set_index('StockCode'),
+                         ['ProductCategory', 'PopularityScore', 'TotalRevenue', 'UniqueCustomers'], '_product')
     
     # Merge country features
-    df = df.merge(country_features[['Country', 'MarketShare', 'RevenuePerCustomer', 
-                                   'TransactionsPerCustomer']], 
-                 on='Country', how='left', suffixes=('', '_country'))
+    df = gather_features(df, 'Country', country_features.set_index('Country'),
+                         ['MarketShare', 'RevenuePerCustomer', 'TransactionsPerCustomer'], '_country')
     
     return df
 
-def create_advanced_features(df):
-    """Create advanced analytical features"""
+@pipeline_stage
+def create_advanced_features(df, basket_features):
+    """Create advanced analytical features from the per-invoice basket aggregates"""
     print("Creating advanced features...")
     
-    # Basket analysis features
-    basket_features = df.groupby('InvoiceNo').agg({
-        'StockCode': 'count',
-        'Revenue': 'sum',
-        'Quantity': 'sum',
-        'CustomerID': 'first',
-        'Country': 'first'
-    }).rename(columns={'StockCode': 'BasketSize'})
-    
-    basket_features['AvgItemValue'] = basket_features['Revenue'] / basket_features['BasketSize']
-    
     # Merge basket features back
-    df = df.merge(basket_features[['BasketSize', 'AvgItemValue']], 
-                 left_on='InvoiceNo', right_index=True, how='left')
+    df = add_basket_features(df, basket_features)
     
     # Cohort features (simplified)
-    df['CohortMonth'] = df.groupby('CustomerID')['InvoiceDate'].transform('min').dt.to_period('M')
-    df['PeriodNumber'] = (df['InvoiceDate'].dt.to_period('M') - df['CohortMonth']).apply(attrgetter('n'))
+    first_purchase = df.groupby('CustomerID')['InvoiceDate'].transform('min')
+    df['CohortMonth'] = first_purchase.dt.to_period('M')
+    df['PeriodNumber'] = month_number(df['InvoiceDate']) - month_number(first_purchase)
     
     return df
 
-def save_featured_data(df, customer_features, product_features, country_features):
-    """Save all featured datasets"""
-    print("Saving featured datasets...")
-    
-    # Get the correct path for saving files
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(script_dir)
-    data_dir = os.path.join(project_root, 'data')
-    
-    # Save main dataset with all features
-    main_path = os.path.join(data_dir, 'featured_data.csv')
-    df.to_csv(main_path, index=False)
-    print(f"Main dataset saved as '{main_path}' with {len(df)} records and {len(df.columns)} features")
-    
-    # Save individual feature datasets
-    customer_path = os.path.join(data_dir, 'customer_features.csv')
-    product_path = os.path.join(data_dir, 'product_features.csv')
-    country_path = os.path.join(data_dir, 'country_features.csv')
-    
-    customer_features.to_csv(customer_path, index=False)
-    product_features.to_csv(product_path, index=False)
-    country_features.to_csv(country_path, index=False)
+def month_number(dates):
+    """Months since year 0 as integers, so month differences are plain subtraction"""
+    return (dates.dt.year.astype('int64') * 12 + dates.dt.month.astype('int64') - 1)
+
+def create_row_features(df):
+    """Create the time and transaction features, which depend on each row only"""
+    df = create_time_features(df)
+    return create_transaction_features(df)
+
+def enrich_transactions(df, customer_features, product_features, country_features, basket_features):
+    """Merge entity, basket and cohort features onto rows that already have their row features"""
+    df = merge_all_features(df, customer_features, product_features, country_features)
+    df = add_basket_features(df, basket_features)
+    return add_cohort_features(df, customer_features)
+
+def add_basket_features(df, basket_features):
+    """Attach basket size and average item value by invoice"""
+    return gather_features(df, 'InvoiceNo', basket_features, ['BasketSize', 'AvgItemValue'])
+
+def add_cohort_features(df, customer_features):
+    """Set cohort month and period number from each customer's first purchase"""
+    first_purchase = df['CustomerID'].map(customer_features.set_index('CustomerID')['FirstPurchase'])
+    df['CohortMonth'] = first_purchase.dt.to_period('M')
+    df['PeriodNumber'] = month_number(df['InvoiceDate']) - month_number(first_purchase)
+    return df
+
+def normalize_keys(df):
+    """Fill missing identifiers and give them the string type of the stored tables"""
+    df['CustomerID'] = df['CustomerID'].fillna('UNKNOWN_CUSTOMER')
+    df['Description'] = df['Description'].fillna('UNKNOWN_DESCRIPTION')
+    for col in STRING_COLUMNS:
+        df[col] = df[col].astype(str)
+    return df
+
+@pipeline_stage
+def save_featured_data(df, customer_features, product_features, country_features, storage_format=DEFAULT_FORMAT,
+                       rollup_cube=None, cohort_retention=None, customer_sketches=None, output_dir=DATA_DIR):
+    """Save all featured datasets (df is None when the main dataset was already streamed to disk)"""
+    print(f"Saving featured datasets ({storage_format})...")
+    
+    formats = STORAGE_FORMATS if storage_format == 'both' else [storage_format]
+    tables = {} if df is None else {'featured_data': df}
+    tables.update({
+        'customer_features': customer_features,
+        'product_features': product_features,
+        'country_features': country_features
+    })
+    if rollup_cube is not None:
+        tables['rollup_cube'] = rollup_cube
+    if cohort_retention is not None:
+        tables['cohort_retention'] = cohort_retention
+    if customer_sketches is not None:
+        tables['customer_sketches'] = customer_sketches
+    
+    for fmt in formats:
+        for name, table in tables.items():
+            path = save_table(table, name, fmt, output_dir)
+            if name == 'featured_data':
+                print(f"Main dataset saved as '{path}' with {len(df)} records and {len(df.columns)} features")
     
     print("Feature engineering completed successfully!")
-    print(f"Files saved:")
-    print(f"- featured_data.csv: {len(df.columns)} columns")
-    print(f"- customer_features.csv: {len(customer_features.columns)} columns")
-    print(f"- product_features.csv: {len(product_features.columns)} columns")
-    print(f"- country_features.csv: {len(country_features.columns)} columns")
+    print(f"Files saved to {output_dir}:")
+    for name, table in tables.items():
+        print(f"- {name} ({', '.join(formats)}): {len(table.columns)} columns")
 
-def main():
+def main(storage_format=DEFAULT_FORMAT, segment_rules=DEFAULT_SEGMENT_RULES, output_dir=DATA_DIR):
     """Main feature engineering pipeline"""
     print("=== ONLINE RETAIL FEATURE ENGINEERING PIPELINE ===")
     
@@ -306,21 +297,279 @@ def main():
     df = create_time_features(df)
     df = create_transaction_features(df)
     
-    # Create aggregated features
-    customer_features = create_customer_features(df)
-    product_features = create_product_features(df)
-    country_features = create_country_features(df)
+    # Create aggregated features; the aggregates double as the incremental state
+    customer_features, product_features, country_features, states = create_entity_features(df, segment_rules)
     
     # Merge features
     df = merge_all_features(df, customer_features, product_features, country_features)
     
     # Advanced features
-    df = create_advanced_features(df)
+    df = create_advanced_features(df, states['basket'])
+    
+    # Dashboard rollups
+    rollup_cube = build_rollup_cube(df)
+    cohort_retention = build_cohort_retention(cohort_activity(df))
+    customer_sketches = build_customer_sketches(df)
     
     # Save all datasets
-    save_featured_data(df, customer_features, product_features, country_features)
+    save_featured_data(df, customer_features, product_features, country_features, storage_format,
+                       rollup_cube=rollup_cube, cohort_retention=cohort_retention,
+                       customer_sketches=customer_sketches, output_dir=output_dir)
+    save_states(states, len(df), df['InvoiceDate'].max(), output_dir)
+    
+    return df, customer_features, product_features, country_features
+
+def run_incremental(storage_format=DEFAULT_FORMAT, segment_rules=DEFAULT_SEGMENT_RULES, output_dir=DATA_DIR):
+    """Fold newly appended source rows into the saved states and refresh the feature tables"""
+    print("=== ONLINE RETAIL INCREMENTAL FEATURE PIPELINE ===")
+    
+    states, manifest = load_states()
+    if manifest is None:
+        print("No incremental state found, running the full pipeline")
+        return main(storage_format, segment_rules, output_dir)
+    
+    # Only the rows appended since the last run
+    batch = load_and_prepare_data(skip_rows=manifest['source_rows'])
+    if batch.empty:
+        print("No new records since the last run")
+        return None
+    
+    batch = normalize_keys(batch)
+    batch = create_time_features(batch)
+    batch = create_transaction_features(batch)
+    
+    # Previously featured rows; categoricals back to plain values so they concat with the batch
+    history = load_table('featured_data')
+    history = history.astype({col: object for col in history.columns
+                              if isinstance(history[col].dtype, pd.CategoricalDtype)})
+    history = history.astype({col: int for col in FLAG_COLUMNS if col in history.columns})
+    
+    # Appends must bring whole new invoices; partial invoices would split baskets
+    overlap = batch['InvoiceNo'].isin(history['InvoiceNo'])
+    if overlap.any():
+        raise ValueError(f"{batch.loc[overlap, 'InvoiceNo'].nunique()} invoices in the new rows were already ingested")
+    
+    # Merge the batch state into the accumulated state
+    batch_states = aggregate_entities(batch)
+    states = merge_states(states, batch_states)
+    latest_date = max(pd.Timestamp(manifest['latest_date']), batch['InvoiceDate'].max())
+    
+    customer_features, product_features, country_features = features_from_states(states, latest_date, segment_rules)
+    
+    # Re-merge entity features onto the history; basket features are unchanged for whole invoices
+    entity_columns = [
+        'CustomerSegment', 'RecencyScore', 'FrequencyScore', 'MonetaryScore', 'RFM_Score', 'TotalRevenue',
+        'Frequency', 'Recency', 'ProductCategory', 'PopularityScore', 'TotalRevenue_product',
+        'UniqueCustomers', 'MarketShare', 'RevenuePerCustomer', 'TransactionsPerCustomer'
+    ]
+    columns = list(history.columns)
+    history = merge_all_features(history.drop(columns=entity_columns), customer_features,
+                                 product_features, country_features)
+    batch = create_advanced_features(merge_all_features(batch, customer_features,
+                                                        product_features, country_features),
+                                     batch_states['basket'])
+    df = pd.concat([history[columns], batch[columns]], ignore_index=True)
+    
+    # Cohorts follow each customer's first purchase across all batches
+    df = add_cohort_features(df, customer_features)
+    
+    rollup_cube = build_rollup_cube(df)
+    cohort_retention = build_cohort_retention(cohort_activity(df))
+    customer_sketches = build_customer_sketches(df)
+    
+    save_featured_data(df, customer_features, product_features, country_features, storage_format,
+                       rollup_cube=rollup_cube, cohort_retention=cohort_retention,
+                       customer_sketches=customer_sketches, output_dir=output_dir)
+    save_states(states, manifest['source_rows'] + len(batch), latest_date, output_dir)
+    
+    return df, customer_features, product_features, country_features
+
+def read_source_chunks(chunksize=DEFAULT_CHUNKSIZE):
+    """Yield the cleaned dataset in chunks with dates, TotalPrice and identifiers prepared"""
+    for chunk in pd.read_csv(SOURCE_PATH, chunksize=chunksize):
+        chunk['InvoiceDate'] = pd.to_datetime(chunk['InvoiceDate'])
+        chunk['TotalPrice'] = chunk['Quantity'] * chunk['UnitPrice']
+        yield normalize_keys(chunk)
+
+@pipeline_stage
+def accumulate_chunk_states(chunksize=DEFAULT_CHUNKSIZE):
+    """First streaming pass: fold every chunk into entity states and per-invoice basket totals"""
+    states = None
+    baskets = []
+    customer_invoices = []
+    source_rows = 0
+    
+    for chunk in read_source_chunks(chunksize):
+        chunk['Revenue'] = chunk['TotalPrice']
+        chunk_states = aggregate_entities(chunk)
+        states = chunk_states if states is None else merge_states(states, chunk_states)
+        
+        # Global row number of each invoice's first line, for the rollup invoice counts
+        basket = chunk_states['basket'][['BasketSize', 'Revenue', 'FirstRow']]
+        baskets.append(basket.assign(FirstRow=basket['FirstRow'] + source_rows))
+        customer_invoices.append(chunk[['CustomerID', 'InvoiceNo']].drop_duplicates())
+        
+        source_rows += len(chunk)
+        print(f"Pass 1: {source_rows} records aggregated")
+    
+    # Invoices split across chunk boundaries appear in two partial baskets
+    basket_features = pd.concat(baskets).groupby(level=0).agg(
+        {'BasketSize': 'sum', 'Revenue': 'sum', 'FirstRow': 'min'})
+    basket_features['AvgItemValue'] = basket_features['Revenue'] / basket_features['BasketSize']
+    
+    # Per-chunk invoice counts double count split invoices, so recount them exactly
+    invoices = pd.concat(customer_invoices).drop_duplicates()['CustomerID'].value_counts()
+    states['customer']['Invoices'] = invoices.reindex(states['customer'].index)
+    
+    return states, basket_features, source_rows
+
+def run_streaming(storage_format=DEFAULT_FORMAT, chunksize=DEFAULT_CHUNKSIZE, segment_rules=DEFAULT_SEGMENT_RULES,
+                  output_dir=DATA_DIR):
+    """Two-pass feature pipeline whose memory is bounded by the chunk size and entity counts"""
+    print("=== ONLINE RETAIL STREAMING FEATURE PIPELINE ===")
+    
+    # Pass 1: aggregate states over the whole source
+    states, basket_features, source_rows = accumulate_chunk_states(chunksize)
+    if source_rows == 0:
+        print("No records to process")
+        return None
+    latest_date = states['customer']['LastPurchase'].max()
+    
+    customer_features, product_features, country_features = features_from_states(states, latest_date, segment_rules)
+    
+    # Pass 2: enrich each chunk and write it straight to disk
+    formats = STORAGE_FORMATS if storage_format == 'both' else [storage_format]
+    writers = [TableWriter('featured_data', fmt, output_dir) for fmt in formats]
+    cubes = []
+    activities = []
+    sketches = []
+    offset = 0
+    try:
+        for chunk in read_source_chunks(chunksize):
+            chunk = create_row_features(chunk)
+            chunk = enrich_transactions(chunk, customer_features, product_features, country_features, basket_features)
+            
+            rows = np.arange(offset, offset + len(chunk))
+            first_lines = pd.Series(rows == chunk['InvoiceNo'].map(basket_features['FirstRow']).values,
+                                    index=chunk.index)
+            cubes.append(build_rollup_cube(chunk, first_lines, verbose=False))
+            activities.append(cohort_activity(chunk))
+            sketches.append(build_customer_sketches(chunk))
+            
+            for writer in writers:
+                writer.write(chunk)
+            offset += len(chunk)
+            print(f"Pass 2: {offset}/{source_rows} records written")
+    finally:
+        for writer in writers:
+            writer.close()
+    
+    for writer in writers:
+        print(f"Main dataset saved as '{writer.path}' with {writer.rows} records and {len(writer.columns)} features")
+    
+    rollup_cube = combine_cubes(cubes)
+    cohort_retention = build_cohort_retention(pd.concat(activities, ignore_index=True))
+    customer_sketches = combine_sketches(sketches)
+    save_featured_data(None, customer_features, product_features, country_features, storage_format,
+                       rollup_cube=rollup_cube, cohort_retention=cohort_retention,
+                       customer_sketches=customer_sketches, output_dir=output_dir)
+    save_states(states, source_rows, latest_date, output_dir)
+    
+    return customer_features, product_features, country_features
+
+def run_parallel(storage_format=DEFAULT_FORMAT, n_jobs=-1, segment_rules=DEFAULT_SEGMENT_RULES, output_dir=DATA_DIR):
+    """Full pipeline with row stages on row blocks and aggregation on entity hash partitions across processes"""
+    n_jobs = resolve_jobs(n_jobs)
+    print(f"=== ONLINE RETAIL PARALLEL FEATURE PIPELINE ({n_jobs} workers) ===")
+    
+    # String keys, so the partitioned customer and product tables can be sorted
+    df = normalize_keys(load_and_prepare_data())
+    
+    # Row features are independent per row
+    df = map_blocks(create_row_features, df, n_jobs)
+    
+    # Entity aggregates are exact per CustomerID / StockCode hash partition
+    states = parallel_aggregate(df, n_jobs)
+    customer_features, product_features, country_features = features_from_states(
+        states, df['InvoiceDate'].max(), segment_rules)
+    
+    # Lookups onto each row block
+    df = map_blocks(enrich_transactions, df, n_jobs, customer_features, product_features,
+                    country_features, states['basket'])
+    
+    rollup_cube = build_rollup_cube(df)
+    cohort_retention = build_cohort_retention(cohort_activity(df))
+    customer_sketches = build_customer_sketches(df)
+    
+    save_featured_data(df, customer_features, product_features, country_features, storage_format,
+                       rollup_cube=rollup_cube, cohort_retention=cohort_retention,
+                       customer_sketches=customer_sketches, output_dir=output_dir)
+    save_states(states, len(df), df['InvoiceDate'].max(), output_dir)
     
     return df, customer_features, product_features, country_features
 
+def parse_args():
+    """Parse command line options for the pipeline"""
+    parser = argparse.ArgumentParser(description="Online Retail feature engineering pipeline")
+    parser.add_argument('--format', dest='storage_format', default=DEFAULT_FORMAT,
+                        choices=STORAGE_FORMATS + ['both'],
+                        help="Storage format for the feature tables (default: parquet)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only process source rows appended since the last run")
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help=f"Stream the source in chunks of this many rows to bound memory "
+                             f"(e.g. {DEFAULT_CHUNKSIZE})")
+    parser.add_argument('--segment-rules', dest='segment_rules', default=None,
+                        help="JSON file of RFM segment rules replacing the default segments")
+    parser.add_argument('--jobs', type=int, default=None,
+                        help="Run the full pipeline on this many worker processes (-1 for all cores)")
+    parser.add_argument('--profile', action='store_true',
+                        help="Record per-stage wall/CPU time, peak RSS and row counts in a JSON run report")
+    parser.add_argument('--profile-dir', dest='profile_dir', default=None,
+                        help="Also dump cProfile stats of each top-level stage call to this directory")
+    parser.add_argument('--report', dest='report_path', default=None,
+                        help="Path of the JSON run report (default: data/reports/pipeline_run_<time>.json)")
+    parser.add_argument('--snapshot', action='store_true',
+                        help="Write the tables to a new versioned snapshot and publish it atomically when done")
+    args = parser.parse_args()
+    if sum([args.incremental, args.chunksize is not None, args.jobs is not None]) > 1:
+        parser.error("--incremental, --chunksize and --jobs cannot be combined")
+    return args
+
 if __name__ == "__main__":
-    df, customer_features, product_features, country_features = main()
+    args = parse_args()
+    segment_rules = DEFAULT_SEGMENT_RULES if args.segment_rules is None else load_segment_rules(args.segment_rules)
+    profiling = args.profile or args.profile_dir is not None or args.report_path is not None
+    if profiling:
+        PROFILER.start(args.profile_dir)
+    
+    # Snapshot runs write to a staging directory that readers never see
+    output_dir = begin_snapshot() if args.snapshot else DATA_DIR
+    result = None
+    try:
+        if args.incremental:
+            mode = 'incremental'
+            result = run_incremental(args.storage_format, segment_rules, output_dir)
+        elif args.chunksize:
+            mode = 'streaming'
+            result = run_streaming(args.storage_format, args.chunksize, segment_rules, output_dir)
+        elif args.jobs is not None:
+            mode = 'parallel'
+            result = run_parallel(args.storage_format, args.jobs, segment_rules, output_dir)
+        else:
+            mode = 'full'
+            result = main(args.storage_format, segment_rules, output_dir)
+    finally:
+        # A failed run still reports the stages it got through
+        if profiling:
+            PROFILER.finish(mode, args.report_path)
+        # Runs that wrote nothing (failed, or no new rows) leave the served tables alone
+        if args.snapshot and result is None:
+            discard_snapshot(output_dir)
+    
+    if result is not None:
+        if args.snapshot:
+            manifest = publish_snapshot(output_dir)
+            print(f"Published snapshot '{manifest['version']}'")
+        elif release_snapshot():
+            print(f"Tables in {DATA_DIR} are served again instead of the last snapshot")
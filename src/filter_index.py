@@ -0,0 +1,84 @@
+# Row index for the dashboard filters over a date-sorted transaction frame
+import pandas as pd
+import numpy as np
+
+def sort_by_date(df):
+    """Return the frame ordered by InvoiceDate with a fresh positional index"""
+    if not df['InvoiceDate'].is_monotonic_increasing:
+        df = df.sort_values('InvoiceDate', kind='mergesort')
+    return df.reset_index(drop=True)
+
+def _rows_by_code(codes, n_codes):
+    """Map each category code to the ascending row positions holding it"""
+    order = np.argsort(codes, kind='stable').astype(np.int32)
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(codes[codes >= 0], minlength=n_codes))])
+    # Missing values (code -1) sort first; skip past them
+    offset = int((codes < 0).sum())
+    return [order[offset + bounds[i]:offset + bounds[i + 1]] for i in range(n_codes)]
+
+def build_filter_index(df, country_col='Country', segment_col='CustomerSegment'):
+    """Build date bounds and code -> row maps for a frame sorted by InvoiceDate"""
+    countries = df[country_col].astype('category')
+    index = {
+        'dates': df['InvoiceDate'].values,
+        'countries': {name: i for i, name in enumerate(countries.cat.categories)},
+        'country_rows': _rows_by_code(countries.cat.codes.values, len(countries.cat.categories)),
+        'segments': {},
+        'segment_rows': [],
+        'pair_rows': {}
+    }
+
+    if segment_col in df.columns:
+        segments = df[segment_col].astype('category')
+        n_segments = len(segments.cat.categories)
+        country_codes = countries.cat.codes.values.astype(np.int64)
+        segment_codes = segments.cat.codes.values.astype(np.int64)
+
+        index['segments'] = {name: i for i, name in enumerate(segments.cat.categories)}
+        index['segment_rows'] = _rows_by_code(segment_codes, n_segments)
+
+        # Combined (country, segment) code so a two-key filter is a single lookup
+        pair_codes = np.where((country_codes >= 0) & (segment_codes >= 0),
+                              country_codes * n_segments + segment_codes, -1)
+        pair_rows = _rows_by_code(pair_codes, len(index['country_rows']) * n_segments)
+        index['pair_rows'] = {code: rows for code, rows in enumerate(pair_rows) if len(rows)}
+        index['n_segments'] = n_segments
+
+    return index
+
+def date_bounds(index, start_date=None, end_date=None):
+    """Binary-search the [lo, hi) row range covering the inclusive date range"""
+    dates = index['dates']
+    lo = 0 if start_date is None else int(dates.searchsorted(np.datetime64(pd.Timestamp(start_date)), 'left'))
+    if end_date is None:
+        hi = len(dates)
+    else:
+        day_after = pd.Timestamp(end_date) + pd.Timedelta(days=1)
+        hi = int(dates.searchsorted(np.datetime64(day_after), 'left'))
+    return lo, hi
+
+def filter_rows(index, start_date=None, end_date=None, country='All', segment='All'):
+    """Return the rows matching the filters as a slice (dates only) or a position array"""
+    lo, hi = date_bounds(index, start_date, end_date)
+    empty = np.empty(0, dtype=np.int32)
+
+    if country == 'All' and segment == 'All':
+        return slice(lo, hi)
+
+    if segment == 'All':
+        code = index['countries'].get(country)
+        rows = empty if code is None else index['country_rows'][code]
+    elif country == 'All':
+        code = index['segments'].get(segment)
+        rows = empty if code is None else index['segment_rows'][code]
+    else:
+        country_code = index['countries'].get(country)
+        segment_code = index['segments'].get(segment)
+        if country_code is None or segment_code is None:
+            rows = empty
+        else:
+            rows = index['pair_rows'].get(country_code * index['n_segments'] + segment_code, empty)
+
+    # Row positions are ascending and the frame is date-sorted, so the date
+    # range is a contiguous run of each position list
+    return rows[rows.searchsorted(lo, 'left'):rows.searchsorted(hi, 'left')]
@@ -0,0 +1,127 @@
+# Mergeable aggregate state for incremental feature engineering
+import pandas as pd
+import numpy as np
+import json
+import os
+from data_store import current_data_source, load_table, save_table
+from aggregation import PAIR_KEYS
+from profiling import pipeline_stage
+
+# State tables and the ingestion manifest live next to the feature tables they
+# were derived from, so a snapshot carries the state matching its tables
+STATE_SUBDIR = 'state'
+
+def state_path(data_dir=None):
+    """Directory of the incremental state stored with the tables of a data directory (the served one by default)"""
+    if data_dir is None:
+        data_dir = current_data_source()[1]
+    return os.path.join(data_dir, STATE_SUBDIR)
+
+# How each state column combines when a new batch is merged in
+CUSTOMER_STATE = {
+    'FirstPurchase': 'min', 'LastPurchase': 'max', 'Transactions': 'sum',
+    'Invoices': 'sum', 'RevenueSum': 'sum', 'RevenueM2': 'm2', 'QuantitySum': 'sum',
+    'UnitPriceSum': 'sum', 'Country': 'first'
+}
+PRODUCT_STATE = {
+    'Description': 'first', 'Lines': 'sum', 'PriceSum': 'sum', 'PriceM2': 'm2',
+    'MinPrice': 'min', 'MaxPrice': 'max', 'QuantitySum': 'sum', 'RevenueSum': 'sum'
+}
+COUNTRY_STATE = {
+    'Lines': 'sum', 'RevenueSum': 'sum', 'QuantitySum': 'sum', 'UnitPriceSum': 'sum'
+}
+
+# (count, sum) columns behind each M2 (sum of squared deviations) column
+M2_INPUTS = {
+    'RevenueM2': ('Transactions', 'RevenueSum'),
+    'PriceM2': ('Lines', 'PriceSum')
+}
+
+def _merge_state(old, new, spec):
+    """Combine two state tables keyed on the same index according to spec"""
+    old, new = old.align(new, join='outer', axis=0)
+    merged = pd.DataFrame(index=old.index)
+
+    for col, how in spec.items():
+        if how == 'sum':
+            merged[col] = old[col].fillna(0) + new[col].fillna(0)
+        elif how == 'min':
+            merged[col] = old[col].where(old[col] <= new[col], new[col]).fillna(old[col])
+        elif how == 'max':
+            merged[col] = old[col].where(old[col] >= new[col], new[col]).fillna(old[col])
+        elif how == 'first':
+            merged[col] = old[col].where(old[col].notna(), new[col])
+
+    # Parallel-axis (Chan et al.) update of the squared-deviation sums
+    for col, how in spec.items():
+        if how != 'm2':
+            continue
+        count_col, sum_col = M2_INPUTS[col]
+        n_old, n_new = old[count_col].fillna(0), new[count_col].fillna(0)
+        mean_old = old[sum_col].fillna(0) / n_old.replace(0, np.nan)
+        mean_new = new[sum_col].fillna(0) / n_new.replace(0, np.nan)
+        delta = (mean_new - mean_old).fillna(0)
+        merged[col] = (old[col].fillna(0) + new[col].fillna(0) +
+                       delta ** 2 * n_old * n_new / (n_old + n_new))
+
+    return merged.sort_index()
+
+@pipeline_stage
+def merge_states(old, new):
+    """Merge a batch state into the accumulated state (basket tables are not carried over)"""
+    print("Merging entity states...")
+    merged = {
+        'customer': _merge_state(old['customer'], new['customer'], CUSTOMER_STATE),
+        'product': _merge_state(old['product'], new['product'], PRODUCT_STATE),
+        'country': _merge_state(old['country'], new['country'], COUNTRY_STATE),
+        'pairs': {}
+    }
+    for name, keys in PAIR_KEYS.items():
+        combined = pd.concat([old['pairs'][name], new['pairs'][name]], ignore_index=True)
+        merged['pairs'][name] = combined.drop_duplicates(keys).reset_index(drop=True)
+    return merged
+
+@pipeline_stage
+def save_states(states, source_rows, latest_date, data_dir=None):
+    """Persist the entity states, pair sets and ingestion watermark next to the tables written to data_dir"""
+    state_dir = state_path(data_dir)
+    os.makedirs(state_dir, exist_ok=True)
+
+    for entity in ['customer', 'product', 'country']:
+        # Keys are stored as strings, like the identifier columns of the feature tables
+        state = states[entity].set_axis(states[entity].index.astype(str)).rename_axis('Key')
+        save_table(state.reset_index(), f'{entity}_state', 'parquet', state_dir)
+    for name, pairs in states['pairs'].items():
+        save_table(pairs, f'{name}_pairs', 'parquet', state_dir)
+
+    manifest = {
+        'source_rows': int(source_rows),
+        'latest_date': pd.Timestamp(latest_date).isoformat(),
+        'updated_at': pd.Timestamp.now().isoformat()
+    }
+    with open(os.path.join(state_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f"Incremental state saved to '{state_dir}' ({source_rows} source rows ingested)")
+
+@pipeline_stage
+def load_states(data_dir=None):
+    """Load the entity states and manifest saved with the served tables, or (None, None) if there are none"""
+    state_dir = state_path(data_dir)
+    manifest_path = os.path.join(state_dir, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return None, None
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    states = {'pairs': {}}
+    for entity in ['customer', 'product', 'country']:
+        state = load_table(f'{entity}_state', data_dir=state_dir)
+        # Back to plain object keys so merges do not mix categoricals with strings
+        states[entity] = state.astype({col: object for col in state.columns
+                                       if isinstance(state[col].dtype, pd.CategoricalDtype)}).set_index('Key')
+    for name in PAIR_KEYS:
+        states['pairs'][name] = load_table(f'{name}_pairs', data_dir=state_dir).astype(object)
+
+    return states, manifest
@@ -0,0 +1,350 @@
+# Local HTTP/JSON service for the dashboard metrics
+#
+# GET /metrics/<name>?start=YYYY-MM-DD&end=YYYY-MM-DD&country=...&segment=...
+# returns one analytics metric for the filters as JSON; /metrics lists the
+# metrics and their extra parameters and /health reports the served snapshot.
+# Encoded responses are kept in a TTL/LRU cache keyed by snapshot version,
+# metric and parameters, and carry an ETag so clients can revalidate with
+# If-None-Match. Requests are handled on a fixed pool of worker threads
+import argparse
+import hashlib
+import inspect
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+import pandas as pd
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import analytics
+from analytics import FilterSpec
+from data_store import DATA_DIR, current_data_source
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8502
+DEFAULT_WORKERS = 8
+DEFAULT_TTL = 300
+DEFAULT_CACHE_ENTRIES = 256
+# Largest n a client may ask for in top-N metrics
+MAX_ROWS = 1000
+
+def _flag(value, data):
+    """Boolean query parameter"""
+    if value.lower() in ('1', 'true', 'yes', 'on'):
+        return True
+    if value.lower() in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(f"expected true or false, got '{value}'")
+
+def _count(value, data):
+    """Positive integer query parameter, capped at MAX_ROWS"""
+    n = int(value)
+    if not 1 <= n <= MAX_ROWS:
+        raise ValueError(f"expected 1 to {MAX_ROWS}, got {n}")
+    return n
+
+def _measure(value, data):
+    """Product ranking measure"""
+    if value not in ('Quantity', 'TotalPrice'):
+        raise ValueError(f"expected Quantity or TotalPrice, got '{value}'")
+    return value
+
+def _category(value, data):
+    """Stored category column, chosen the way the dashboard chooses it"""
+    if value not in data.available_columns() or not ('Category' in value or 'Type' in value):
+        raise ValueError(f"'{value}' is not a stored category column")
+    return value
+
+# Metrics served, with the parsers of the parameters each takes besides the filters
+METRIC_PARAMS = {
+    'kpi_metrics': {'approximate': _flag},
+    'customer_count': {'approximate': _flag},
+    'daily_revenue': {},
+    'daily_revenue_points': {'max_points': _count},
+    'revenue_forecast': {'horizon': _count, 'max_points': _count},
+    'monthly_revenue': {},
+    'segment_counts': {},
+    'top_customers': {'n': _count},
+    'top_products': {'measure': _measure, 'n': _count},
+    'country_revenue': {'n': _count},
+    'country_customers': {'n': _count, 'approximate': _flag},
+    'hourly_revenue': {},
+    'customer_values': {},
+    'order_frequency': {},
+    'monthly_growth': {},
+    'segment_performance': {},
+    'category_performance': {'cat_col': _category},
+    'product_performance': {'n': _count},
+    'price_demand': {},
+    'weekday_revenue': {},
+    'order_size_distribution': {},
+    'business_metrics': {'approximate': _flag},
+    'weekday_hour_revenue': {},
+    'quarterly_performance': {},
+    'customer_acquisition': {},
+    'monthly_active_customers': {'approximate': _flag},
+    'churn_distribution': {},
+    'customer_activity': {'n': _count},
+    'product_demand_trend': {'n': _count},
+    'market_opportunity': {'approximate': _flag}
+}
+FILTER_PARAMS = ['start', 'end', 'country', 'segment']
+
+class RequestError(Exception):
+    """Request the service cannot answer, with the HTTP status to reply with"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def parse_filters(query):
+    """FilterSpec from the start, end, country and segment query parameters"""
+    try:
+        start_date = date.fromisoformat(query['start']) if query.get('start') else None
+        end_date = date.fromisoformat(query['end']) if query.get('end') else None
+    except ValueError as e:
+        raise RequestError(400, f"Invalid date: {e}")
+    return FilterSpec(start_date, end_date, query.get('country') or 'All', query.get('segment') or 'All')
+
+def parse_params(name, query, data):
+    """Extra metric parameters from the query, sorted by name so equal requests share a cache key"""
+    parsers = METRIC_PARAMS[name]
+    unknown = set(query) - set(parsers) - set(FILTER_PARAMS)
+    if unknown:
+        raise RequestError(400, f"Unknown parameter(s) for '{name}': {', '.join(sorted(unknown))}")
+    signature = inspect.signature(getattr(analytics, name))
+    missing = [param for param in parsers
+               if signature.parameters[param].default is inspect.Parameter.empty and param not in query]
+    if missing:
+        raise RequestError(400, f"Missing parameter(s) for '{name}': {', '.join(missing)}")
+    params = {}
+    for param in sorted(set(query) & set(parsers)):
+        try:
+            params[param] = parsers[param](query[param], data)
+        except ValueError as e:
+            raise RequestError(400, f"Invalid '{param}': {e}")
+    return params
+
+def to_json_value(value):
+    """Metric result in plain JSON types; frames and series become lists of row records"""
+    if isinstance(value, pd.Series):
+        value = value.to_frame(value.name if value.name is not None else 'value')
+    if isinstance(value, pd.DataFrame):
+        # Named indexes (dates, countries, ...) become columns; row positions are dropped
+        value = value.reset_index(drop=all(name is None for name in value.index.names))
+        # Month periods and category labels are sent as their text
+        for col in value.columns:
+            if isinstance(value[col].dtype, (pd.PeriodDtype, pd.CategoricalDtype, pd.IntervalDtype)):
+                value[col] = value[col].astype(str)
+        return json.loads(value.to_json(orient='records', date_format='iso', default_handler=str))
+    if isinstance(value, dict):
+        return {str(key): to_json_value(item) for key, item in value.items()}
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+class ResponseCache:
+    """Thread-safe LRU cache of encoded responses, each expiring ttl seconds after it was stored"""
+
+    def __init__(self, max_entries=DEFAULT_CACHE_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Cached response for the key, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, response):
+        """Store a response, evicting the least recently used ones beyond max_entries"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every cached response"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Entry count and hit/miss counters"""
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+def encode(payload):
+    """JSON body of a payload and its ETag"""
+    body = json.dumps(payload, separators=(',', ':'), allow_nan=False).encode('utf-8')
+    return body, '"' + hashlib.sha1(body).hexdigest() + '"'
+
+class MetricsService:
+    """Answers metric requests from a RetailData source, following newly published snapshots"""
+
+    def __init__(self, data_dir=None, shared=False, cache_entries=DEFAULT_CACHE_ENTRIES, ttl=DEFAULT_TTL):
+        self.data_dir = data_dir or DATA_DIR
+        self.shared = shared
+        self.cache = ResponseCache(cache_entries, ttl)
+        self._data = analytics.RetailData(self.data_dir, shared)
+        self._lock = threading.Lock()
+
+    def data(self):
+        """Source for the snapshot served now, replaced (with the cache cleared) once a newer one is published"""
+        version = current_data_source(self.data_dir)[0]
+        if version != self._data.version:
+            with self._lock:
+                if version != self._data.version:
+                    self._data = analytics.RetailData(self.data_dir, self.shared)
+                    self.cache.clear()
+        return self._data
+
+    def metric(self, name, query):
+        """Encoded response of one metric for the query, from the cache when possible"""
+        if name not in METRIC_PARAMS:
+            raise RequestError(404, f"Unknown metric '{name}'")
+        data = self.data()
+        filters = parse_filters(query)
+        params = parse_params(name, query, data)
+
+        key = (data.version, name, filters, tuple(params.items()))
+        response = self.cache.get(key)
+        if response is None:
+            result = getattr(analytics, name)(data, filters, **params)
+            response = encode({
+                'metric': name,
+                'version': data.version,
+                'filters': {field: None if value is None else str(value) for field, value in filters._asdict().items()},
+                'params': params,
+                'result': to_json_value(result)
+            })
+            self.cache.put(key, response)
+        return response
+
+    def handle(self, path, query):
+        """Encoded response for a GET path and its query parameters"""
+        parts = [part for part in path.split('/') if part]
+        if parts == ['health']:
+            return encode({'status': 'ok', 'version': self.data().version, 'cache': self.cache.stats()})
+        if parts == ['metrics']:
+            return encode({'metrics': {name: sorted(params) for name, params in METRIC_PARAMS.items()},
+                           'filters': FILTER_PARAMS})
+        if len(parts) == 2 and parts[0] == 'metrics':
+            return self.metric(parts[1], query)
+        raise RequestError(404, f"Unknown path '{path}'")
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """GET handler replying with the service's JSON responses"""
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            body, etag = self.server.service.handle(url.path, query)
+            status = 200
+        except RequestError as e:
+            (body, etag), status = encode({'error': str(e)}), e.status
+        except FileNotFoundError as e:
+            (body, etag), status = encode({'error': str(e)}), 503
+        except Exception as e:
+            (body, etag), status = encode({'error': f"{type(e).__name__}: {e}"}), 500
+
+        # Unchanged responses are revalidated without sending the body again
+        if status == 200 and etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 200:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', f'max-age={self.server.service.cache.ttl}')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+class PooledHTTPServer(HTTPServer):
+    """HTTP server handing each connection to a fixed pool of worker threads"""
+
+    def __init__(self, address, service, workers=DEFAULT_WORKERS, verbose=False):
+        super().__init__(address, MetricsRequestHandler)
+        self.service = service
+        self.verbose = verbose
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='metrics')
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+def make_server(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=DEFAULT_WORKERS, ttl=DEFAULT_TTL,
+                cache_entries=DEFAULT_CACHE_ENTRIES, data_dir=None, shared=False, verbose=False):
+    """Metrics server bound to host:port; call serve_forever() to start answering"""
+    service = MetricsService(data_dir, shared, cache_entries, ttl)
+    return PooledHTTPServer((host, port), service, workers, verbose)
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Serve the dashboard metrics as JSON over HTTP")
+    parser.add_argument('--host', default=DEFAULT_HOST,
+                        help=f"Address to listen on (default: {DEFAULT_HOST})")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help=f"Port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f"Worker threads answering requests (default: {DEFAULT_WORKERS})")
+    parser.add_argument('--ttl', type=float, default=DEFAULT_TTL,
+                        help=f"Seconds a cached response is reused (default: {DEFAULT_TTL})")
+    parser.add_argument('--cache-entries', type=int, default=DEFAULT_CACHE_ENTRIES,
+                        help=f"Responses kept in the cache (default: {DEFAULT_CACHE_ENTRIES})")
+    parser.add_argument('--data-dir', default=None,
+                        help="Data directory to serve (default: the project data directory)")
+    parser.add_argument('--shared', action='store_true',
+                        help="Map the dashboard columns from their shared Arrow copy")
+    parser.add_argument('--verbose', action='store_true', help="Log every request")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = make_server(args.host, args.port, args.workers, args.ttl, args.cache_entries,
+                         args.data_dir, args.shared, args.verbose)
+    print(f"🌐 Metrics service available at: http://{args.host}:{args.port}/metrics")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Metrics service stopped")
+    finally:
+        server.server_close()
@@ -0,0 +1,85 @@
+# Process-parallel execution of the feature pipeline stages
+import pandas as pd
+import numpy as np
+from joblib import Parallel, delayed, cpu_count
+from aggregation import aggregate_entities
+from profiling import pipeline_stage
+
+# Tables aggregated over CustomerID hash partitions and over StockCode hash
+# partitions. Every customer (product) lands in exactly one partition with its
+# rows in file order, so per-entity aggregates, 'first' values and distinct
+# counts are exact; country and basket totals are summed across partitions
+CUSTOMER_PARTITION_TABLES = ['customer', 'country', 'basket', 'country_customer']
+PRODUCT_PARTITION_TABLES = ['product', 'product_customer', 'product_country']
+
+# Columns the aggregation workers need
+AGGREGATION_COLUMNS = [
+    'InvoiceNo', 'StockCode', 'Description', 'Quantity', 'InvoiceDate',
+    'UnitPrice', 'CustomerID', 'Country', 'Revenue'
+]
+
+def resolve_jobs(n_jobs):
+    """Number of worker processes for a joblib-style n_jobs value (-1 means all cores)"""
+    return cpu_count() if n_jobs is None or n_jobs < 1 else n_jobs
+
+def row_blocks(df, n_blocks):
+    """Split a frame into contiguous, non-empty row blocks"""
+    bounds = np.linspace(0, len(df), n_blocks + 1).astype(int)
+    return [df.iloc[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+
+def map_blocks(func, df, n_jobs, *args):
+    """Apply a row-wise stage to contiguous row blocks in parallel and reassemble them in order"""
+    blocks = row_blocks(df, n_jobs)
+    results = Parallel(n_jobs=n_jobs)(delayed(func)(block, *args) for block in blocks)
+    return pd.concat(results, ignore_index=True)
+
+def hash_partitions(keys, n_parts):
+    """Ascending row positions of each partition of a key column, assigned by key hash"""
+    part = pd.util.hash_pandas_object(keys, index=False).to_numpy() % n_parts
+    partitions = [np.flatnonzero(part == i) for i in range(n_parts)]
+    return [rows for rows in partitions if len(rows)]
+
+def _aggregate_partition(df, rows, tables):
+    """Aggregate one hash partition, mapping basket first rows back to global positions"""
+    aggregates = aggregate_entities(df, tables, verbose=False)
+    if 'basket' in aggregates:
+        aggregates['basket']['FirstRow'] = rows[aggregates['basket']['FirstRow'].to_numpy()]
+    return aggregates
+
+@pipeline_stage
+def parallel_aggregate(df, n_jobs):
+    """Aggregate the entity tables over CustomerID and StockCode hash partitions in parallel"""
+    print(f"Aggregating customer, product, country and basket tables on {n_jobs} workers...")
+
+    data = df[AGGREGATION_COLUMNS]
+    customer_partitions = hash_partitions(df['CustomerID'], n_jobs)
+    product_partitions = hash_partitions(df['StockCode'], n_jobs)
+
+    tasks = [delayed(_aggregate_partition)(data.iloc[rows], rows, CUSTOMER_PARTITION_TABLES)
+             for rows in customer_partitions]
+    tasks += [delayed(_aggregate_partition)(data.iloc[rows], rows, PRODUCT_PARTITION_TABLES)
+              for rows in product_partitions]
+    results = Parallel(n_jobs=n_jobs)(tasks)
+    customer_parts = results[:len(customer_partitions)]
+    product_parts = results[len(customer_partitions):]
+
+    # Customers and products are disjoint across partitions; countries and
+    # invoices can span several customer partitions
+    basket_features = pd.concat([part['basket'] for part in customer_parts]).groupby(level=0).agg(
+        {'BasketSize': 'sum', 'Revenue': 'sum', 'FirstRow': 'min'})
+    basket_features['AvgItemValue'] = basket_features['Revenue'] / basket_features['BasketSize']
+
+    return {
+        'customer': pd.concat([part['customer'] for part in customer_parts]).sort_index(),
+        'product': pd.concat([part['product'] for part in product_parts]).sort_index(),
+        'country': pd.concat([part['country'] for part in customer_parts]).groupby(level=0).sum(),
+        'pairs': {
+            'country_customer': pd.concat([part['pairs']['country_customer'] for part in customer_parts],
+                                          ignore_index=True),
+            'product_customer': pd.concat([part['pairs']['product_customer'] for part in product_parts],
+                                          ignore_index=True),
+            'product_country': pd.concat([part['pairs']['product_country'] for part in product_parts],
+                                         ignore_index=True)
+        },
+        'basket': basket_features
+    }
@@ -0,0 +1,64 @@
+# Binned price-demand aggregation over log-spaced unit price bins
+import pandas as pd
+import numpy as np
+
+# Number of log-spaced price bins; the price chart never has more points than this
+DEFAULT_PRICE_BINS = 40
+
+def log_price_edges(prices, n_bins=DEFAULT_PRICE_BINS):
+    """Log-spaced bin edges spanning the range of positive prices"""
+    low, high = prices.min(), prices.max()
+    if high <= low:
+        high = low * 1.01
+    return np.geomspace(low, high, n_bins + 1)
+
+def bin_quantiles(bins, values, n_bins, quantiles):
+    """Linearly interpolated quantiles of values within each bin, one array per quantile"""
+    order = np.lexsort((values, bins))
+    sorted_values = values[order]
+    counts = np.bincount(bins, minlength=n_bins)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    results = []
+    for q in quantiles:
+        position = starts + q * np.maximum(counts - 1, 0)
+        low = np.floor(position).astype(np.intp)
+        high = np.minimum(low + 1, starts + np.maximum(counts - 1, 0)).astype(np.intp)
+        fraction = position - low
+        # Empty bins are dropped by the caller; clip keeps their lookups in range
+        low, high = np.clip(low, 0, len(values) - 1), np.clip(high, 0, len(values) - 1)
+        results.append(sorted_values[low] * (1 - fraction) + sorted_values[high] * fraction)
+    return results
+
+def price_demand_bins(prices, quantity, revenue, n_bins=DEFAULT_PRICE_BINS, quantiles=None):
+    """Quantity and revenue per log-spaced unit price bin, with optional per-bin quantiles of line quantity"""
+    prices = np.asarray(prices, dtype=np.float64)
+    quantity = np.asarray(quantity, dtype=np.float64)
+    revenue = np.asarray(revenue, dtype=np.float64)
+
+    # Free items and returns without a price have no place on a log price axis
+    priced = prices > 0
+    prices, quantity, revenue = prices[priced], quantity[priced], revenue[priced]
+    columns = ['PriceLow', 'PriceHigh', 'UnitPrice', 'Quantity', 'TotalPrice', 'Lines']
+    columns += [f"QuantityP{round(q * 100)}" for q in quantiles or []]
+    if len(prices) == 0:
+        return pd.DataFrame(columns=columns)
+
+    edges = log_price_edges(prices, n_bins)
+    # Equal widths in log space give each price's bin directly, without a
+    # search over the edges; the clip puts the maximum price in the last bin
+    log_low, log_width = np.log(edges[0]), np.log(edges[-1] / edges[0]) / n_bins
+    bins = np.clip(((np.log(prices) - log_low) / log_width).astype(np.intp), 0, n_bins - 1)
+    lines = np.bincount(bins, minlength=n_bins)
+    binned = pd.DataFrame({
+        'PriceLow': edges[:-1],
+        'PriceHigh': edges[1:],
+        'UnitPrice': np.bincount(bins, weights=prices, minlength=n_bins) / np.maximum(lines, 1),
+        'Quantity': np.bincount(bins, weights=quantity, minlength=n_bins),
+        'TotalPrice': np.bincount(bins, weights=revenue, minlength=n_bins),
+        'Lines': lines
+    })
+    if quantiles:
+        for q, values in zip(quantiles, bin_quantiles(bins, quantity, n_bins, quantiles)):
+            binned[f"QuantityP{round(q * 100)}"] = values
+
+    return binned[binned['Lines'] > 0].reset_index(drop=True)
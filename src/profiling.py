@@ -0,0 +1,174 @@
+# Stage-level timing, memory and row count instrumentation for the pipeline
+import pandas as pd
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from functools import wraps
+import psutil
+from data_store import DATA_DIR
+
+# Run reports are written here unless a path is given
+REPORT_DIR = os.path.join(DATA_DIR, 'reports')
+
+# How often the background sampler reads the resident set size
+RSS_SAMPLE_SECONDS = 0.01
+
+MB = 1024 ** 2
+
+def _row_counts(value):
+    """Row count of a frame, or of each frame in a tuple of results"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, tuple):
+        counts = [_row_counts(item) for item in value]
+        return [count for count in counts if count is not None] or None
+    return None
+
+class PipelineProfiler:
+    """Records wall time, CPU time, peak RSS and row counts of each pipeline stage call"""
+
+    def __init__(self):
+        self.enabled = False
+        self.stages = []
+        self.profile_dir = None
+        self._process = psutil.Process()
+        self._depth = 0
+        self._peak = 0
+        self._sampler = None
+        self._stop = threading.Event()
+
+    def __reduce__(self):
+        # Worker processes get their own (disabled) profiler instead of a copy of this one
+        return (process_profiler, ())
+
+    def start(self, profile_dir=None):
+        """Begin recording; with profile_dir each top-level stage call also dumps cProfile stats"""
+        self.enabled = True
+        self.stages = []
+        self.profile_dir = profile_dir
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+        self._started = time.time()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self._peak = self._rss()
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+
+    def _rss(self):
+        return self._process.memory_info().rss
+
+    def _sample(self):
+        """Track the running RSS maximum between stage boundaries"""
+        while not self._stop.wait(RSS_SAMPLE_SECONDS):
+            self._peak = max(self._peak, self._rss())
+
+    def run(self, name, func, args, kwargs):
+        """Call a stage function and record its measurements"""
+        rss_start = self._rss()
+        # Peak of the enclosing stage so far; this stage measures its own peak
+        outer_peak = max(self._peak, rss_start)
+        self._peak = rss_start
+        depth = self._depth
+        profile_path = None
+        profiler = None
+        if self.profile_dir and depth == 0:
+            profile_path = os.path.join(self.profile_dir, f"{len(self.stages):03d}_{name}.prof")
+            profiler = cProfile.Profile()
+
+        record = {'stage': name, 'depth': depth, 'rows_in': next(
+            (_row_counts(arg) for arg in args if isinstance(arg, (pd.DataFrame, pd.Series))), None)}
+        self.stages.append(record)
+        self._depth += 1
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            result = profiler.runcall(func, *args, **kwargs) if profiler else func(*args, **kwargs)
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            self._depth -= 1
+            rss_end = self._rss()
+            stage_peak = max(self._peak, rss_end)
+            self._peak = max(outer_peak, stage_peak)
+            if profiler:
+                profiler.dump_stats(profile_path)
+
+        record.update({
+            'rows_out': _row_counts(result),
+            'wall_s': round(wall, 4),
+            'cpu_s': round(cpu, 4),
+            'rss_start_mb': round(rss_start / MB, 1),
+            'rss_end_mb': round(rss_end / MB, 1),
+            'peak_rss_mb': round(stage_peak / MB, 1),
+            'profile': profile_path
+        })
+        return result
+
+    def summary(self):
+        """Per-stage totals over all calls (streaming and incremental runs call stages repeatedly)"""
+        totals = {}
+        for record in self.stages:
+            if 'wall_s' not in record:
+                continue
+            total = totals.setdefault(record['stage'], {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'peak_rss_mb': 0.0})
+            total['calls'] += 1
+            total['wall_s'] = round(total['wall_s'] + record['wall_s'], 4)
+            total['cpu_s'] = round(total['cpu_s'] + record['cpu_s'], 4)
+            total['peak_rss_mb'] = max(total['peak_rss_mb'], record['peak_rss_mb'])
+        return totals
+
+    def finish(self, mode, report_path=None):
+        """Stop recording, print the stage summary and write the JSON run report"""
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self.enabled = False
+
+        summary = self.summary()
+        report = {
+            'mode': mode,
+            'argv': sys.argv[1:],
+            'started_at': pd.Timestamp(self._started, unit='s').isoformat(),
+            'wall_s': round(time.perf_counter() - self._wall, 4),
+            'cpu_s': round(time.process_time() - self._cpu, 4),
+            'peak_rss_mb': round(max(self._peak, self._rss()) / MB, 1),
+            'stages': self.stages,
+            'summary': summary
+        }
+
+        if report_path is None:
+            os.makedirs(REPORT_DIR, exist_ok=True)
+            stamp = pd.Timestamp(self._started, unit='s').strftime('%Y%m%d_%H%M%S')
+            report_path = os.path.join(REPORT_DIR, f"pipeline_run_{stamp}.json")
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+        print_stage_summary(summary, report)
+        print(f"Run report saved to '{report_path}'")
+        return report
+
+def print_stage_summary(summary, report):
+    """Print per-stage totals and the run totals"""
+    print(f"{'Stage':<28}{'Calls':>7}{'Wall (s)':>11}{'CPU (s)':>11}{'Peak RSS (MB)':>15}")
+    for name, total in summary.items():
+        print(f"{name:<28}{total['calls']:>7}{total['wall_s']:>11.3f}{total['cpu_s']:>11.3f}{total['peak_rss_mb']:>15.1f}")
+    print(f"{'Total':<35}{report['wall_s']:>11.3f}{report['cpu_s']:>11.3f}{report['peak_rss_mb']:>15.1f}")
+
+# Process-wide profiler used by the pipeline_stage decorator
+PROFILER = PipelineProfiler()
+
+def process_profiler():
+    """The profiler of the current process"""
+    return PROFILER
+
+def pipeline_stage(func):
+    """Record the decorated stage function in the pipeline profiler while it is enabled"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not PROFILER.enabled:
+            return func(*args, **kwargs)
+        return PROFILER.run(func.__name__, func, args, kwargs)
+    return wrapper
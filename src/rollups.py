@@ -0,0 +1,171 @@
+# Pre-aggregated rollups served to the dashboard
+import pandas as pd
+import numpy as np
+from profiling import pipeline_stage
+
+# Cube grain: one row per (day, hour, country, customer segment) cell
+CUBE_KEYS = ['Date', 'Hour', 'Country', 'CustomerSegment']
+CUBE_MEASURES = ['Revenue', 'Quantity', 'Lines', 'Invoices']
+
+@pipeline_stage
+def build_rollup_cube(df, first_lines=None, verbose=True):
+    """Aggregate the featured transactions into the (Date, Hour, Country, CustomerSegment) cube"""
+    if verbose:
+        print("Building rollup cube...")
+
+    keys = pd.DataFrame({
+        'Date': df['InvoiceDate'].dt.normalize(),
+        'Hour': df['InvoiceDate'].dt.hour,
+        'Country': df['Country'],
+        'CustomerSegment': df['CustomerSegment']
+    })
+
+    cube = pd.DataFrame({
+        'Revenue': df['TotalPrice'],
+        'Quantity': df['Quantity'],
+        'Lines': 1
+    }).groupby([keys[key] for key in CUBE_KEYS], observed=True, dropna=False).sum()
+
+    # Each invoice is counted once, in the cell of its first line, so invoice
+    # counts stay additive when cells are summed for any filter combination.
+    # Chunked callers pass their own mask so a split invoice is counted once
+    if first_lines is None:
+        first_lines = ~df['InvoiceNo'].duplicated()
+    invoices = keys[first_lines].groupby(CUBE_KEYS, observed=True, dropna=False).size()
+    cube['Invoices'] = invoices.reindex(cube.index, fill_value=0)
+
+    cube = cube.reset_index()
+    if verbose:
+        print(f"Rollup cube built with {len(cube)} cells from {len(df)} records")
+    return cube
+
+def combine_cubes(cubes):
+    """Sum partial cubes built from disjoint chunks of transactions"""
+    cube = pd.concat(cubes, ignore_index=True)
+    return cube.groupby(CUBE_KEYS, observed=True, dropna=False, sort=True)[CUBE_MEASURES].sum().reset_index()
+
+def filter_cube(cube, start_date=None, end_date=None, country='All', segment='All'):
+    """Select the cube cells matching the dashboard filters (dates are inclusive)"""
+    mask = pd.Series(True, index=cube.index)
+
+    if start_date is not None:
+        mask &= cube['Date'] >= pd.Timestamp(start_date)
+    if end_date is not None:
+        mask &= cube['Date'] <= pd.Timestamp(end_date)
+    if country != 'All':
+        mask &= cube['Country'] == country
+    if segment != 'All':
+        mask &= cube['CustomerSegment'] == segment
+
+    return cube[mask]
+
+# Measures kept as running totals over the day axis for the KPI cards
+KPI_MEASURES = ['Revenue', 'Lines', 'Invoices']
+
+def build_kpi_prefix_sums(cube, measures=KPI_MEASURES):
+    """Running totals of the measures over a dense day axis for every (country, segment) pair, 'All' included"""
+    dates = cube['Date'].dt.normalize()
+    first, last = dates.min(), dates.max()
+    n_days = (last - first).days + 1 if len(cube) else 0
+    days = ((dates - first) // pd.Timedelta(days=1)).to_numpy(dtype=np.intp)
+
+    countries = pd.Categorical(cube['Country'])
+    segments = pd.Categorical(cube['CustomerSegment'])
+    n_countries, n_segments = len(countries.categories), len(segments.categories)
+    # Missing keys get their own slot after the named ones, so they still count
+    # towards 'All'; the last slot of each axis is 'All'
+    country_codes = np.where(countries.codes < 0, n_countries, countries.codes).astype(np.intp)
+    segment_codes = np.where(segments.codes < 0, n_segments, segments.codes).astype(np.intp)
+    all_country, all_segment = n_countries + 1, n_segments + 1
+    shape = (n_countries + 2, n_segments + 2, n_days)
+
+    totals = np.zeros(shape + (len(measures),))
+    for c, s in [(country_codes, segment_codes), (all_country, segment_codes),
+                 (country_codes, all_segment), (all_country, all_segment)]:
+        cells = np.ravel_multi_index((np.broadcast_to(c, days.shape), np.broadcast_to(s, days.shape), days), shape)
+        for i, measure in enumerate(measures):
+            totals[..., i] += np.bincount(cells, weights=cube[measure].to_numpy(dtype=np.float64),
+                                          minlength=np.prod(shape)).reshape(shape)
+
+    # prefix[c, s, d] holds the totals of the days before day d
+    prefix = np.zeros((shape[0], shape[1], n_days + 1, len(measures)))
+    np.cumsum(totals, axis=2, out=prefix[:, :, 1:])
+    return {
+        'first_day': first,
+        'n_days': n_days,
+        'measures': list(measures),
+        'countries': {name: i for i, name in enumerate(countries.categories)},
+        'segments': {name: i for i, name in enumerate(segments.categories)},
+        'all_country': all_country,
+        'all_segment': all_segment,
+        'prefix': prefix
+    }
+
+def _day_range(prefix_sums, start_date, end_date):
+    """Prefix sum offsets (lo, hi) of an inclusive date range, clipped to the day axis"""
+    n_days = prefix_sums['n_days']
+    lo = 0 if start_date is None else (pd.Timestamp(start_date) - prefix_sums['first_day']).days
+    hi = n_days if end_date is None else (pd.Timestamp(end_date) - prefix_sums['first_day']).days + 1
+    return min(max(lo, 0), n_days), min(max(hi, 0), n_days)
+
+def range_totals(prefix_sums, start_date=None, end_date=None, country='All', segment='All'):
+    """Measure totals over an inclusive date range as the difference of two prefix sum lookups"""
+    measures = prefix_sums['measures']
+    country_code = prefix_sums['all_country'] if country == 'All' else prefix_sums['countries'].get(country)
+    segment_code = prefix_sums['all_segment'] if segment == 'All' else prefix_sums['segments'].get(segment)
+    lo, hi = _day_range(prefix_sums, start_date, end_date)
+    if country_code is None or segment_code is None or hi <= lo:
+        return dict.fromkeys(measures, 0.0)
+
+    cumulative = prefix_sums['prefix'][country_code, segment_code]
+    return dict(zip(measures, (cumulative[hi] - cumulative[lo]).tolist()))
+
+def country_range_totals(prefix_sums, start_date=None, end_date=None, segment='All'):
+    """Per-country measure totals over an inclusive date range, for the countries with lines in it"""
+    measures = prefix_sums['measures']
+    countries = pd.Index(list(prefix_sums['countries']), name='Country')
+    segment_code = prefix_sums['all_segment'] if segment == 'All' else prefix_sums['segments'].get(segment)
+    lo, hi = _day_range(prefix_sums, start_date, end_date)
+    if segment_code is None or hi <= lo:
+        return pd.DataFrame(columns=measures, index=countries[:0], dtype=np.float64)
+
+    # One subtraction per named country, however wide the date range is
+    cumulative = prefix_sums['prefix'][:len(countries), segment_code]
+    totals = pd.DataFrame(cumulative[:, hi] - cumulative[:, lo], index=countries, columns=measures)
+    return totals[totals['Lines'] > 0]
+
+# Cohort table grain: one row per (first-purchase month, months since) pair
+COHORT_KEYS = ['CohortMonth', 'PeriodNumber']
+
+def cohort_activity(df):
+    """Revenue and lines per (CohortMonth, PeriodNumber, CustomerID)"""
+    activity = pd.DataFrame({
+        'Revenue': df['TotalPrice'],
+        'Lines': 1
+    }).groupby([df[key] for key in COHORT_KEYS + ['CustomerID']], observed=True).sum()
+    return activity.reset_index()
+
+@pipeline_stage
+def build_cohort_retention(activity):
+    """Aggregate (partial) cohort activity into the cohort x period retention matrix in long form"""
+    print("Building cohort retention matrix...")
+
+    # Partial activity from several chunks may repeat a customer in a cell
+    keys = COHORT_KEYS + ['CustomerID']
+    activity = activity.groupby(keys, observed=True)[['Revenue', 'Lines']].sum().reset_index()
+
+    retention = activity.groupby(COHORT_KEYS, observed=True).agg(
+        Customers=('CustomerID', 'size'),
+        Revenue=('Revenue', 'sum'),
+        Lines=('Lines', 'sum')
+    ).reset_index()
+
+    # Every customer is active in their own first month, so period 0 is the cohort size
+    cohort_size = retention.loc[retention['PeriodNumber'] == 0].set_index('CohortMonth')['Customers']
+    retention['CohortSize'] = retention['CohortMonth'].map(cohort_size)
+    retention['RetentionRate'] = (retention['Customers'] / retention['CohortSize']).round(4)
+    retention['Revenue'] = retention['Revenue'].round(2)
+
+    print(f"Cohort retention matrix built with {retention['CohortMonth'].nunique()} cohorts "
+          f"and {len(retention)} cells")
+    return retention
@@ -0,0 +1,55 @@
+# Vectorized RFM customer segmentation
+import numpy as np
+import json
+
+# RFM scores run from 1 to 5
+SCORES = np.arange(1, 6)
+
+# Ordered segment rules: a customer gets the first segment whose inclusive
+# (low, high) score bounds all hold. A rule without bounds matches everyone
+DEFAULT_SEGMENT_RULES = [
+    ('Champions', {'R': (4, 5), 'F': (4, 5), 'M': (4, 5)}),
+    ('Loyal Customers', {'R': (3, 5), 'F': (3, 5), 'M': (3, 5)}),
+    ('New Customers', {'R': (4, 5), 'F': (1, 2)}),
+    ('At Risk', {'R': (1, 2), 'F': (3, 5)}),
+    ('Lost Customers', {'R': (1, 2), 'F': (1, 2)}),
+    ('Potential Loyalists', {})
+]
+
+def build_segment_table(rules=DEFAULT_SEGMENT_RULES):
+    """Precompute the segment of every (R, F, M) combination as a 5x5x5 code table and its labels"""
+    r, f, m = np.meshgrid(SCORES, SCORES, SCORES, indexing='ij')
+    scores = {'R': r, 'F': f, 'M': m}
+
+    labels = list(dict.fromkeys(name for name, _ in rules))
+    conditions = []
+    for name, bounds in rules:
+        condition = np.ones(r.shape, dtype=bool)
+        for score, (low, high) in bounds.items():
+            condition &= (scores[score] >= low) & (scores[score] <= high)
+        conditions.append(condition)
+
+    codes = np.select(conditions, [labels.index(name) for name, _ in rules], default=-1)
+    if (codes < 0).any():
+        raise ValueError("Segment rules do not cover every (R, F, M) score combination")
+
+    return codes.astype(np.int8), labels
+
+def assign_segments(recency, frequency, monetary, rules=DEFAULT_SEGMENT_RULES):
+    """Look up the segment name of each customer from integer 1-5 R, F and M score arrays"""
+    table, labels = build_segment_table(rules)
+    codes = table[np.asarray(recency, dtype=np.intp) - 1,
+                  np.asarray(frequency, dtype=np.intp) - 1,
+                  np.asarray(monetary, dtype=np.intp) - 1]
+    return np.array(labels, dtype=object)[codes]
+
+def load_segment_rules(path):
+    """Read segment rules from a JSON list of {"segment": name, "R": [low, high], ...} entries"""
+    with open(path) as f:
+        entries = json.load(f)
+
+    rules = []
+    for entry in entries:
+        bounds = {score: tuple(entry[score]) for score in ['R', 'F', 'M'] if score in entry}
+        rules.append((entry['segment'], bounds))
+    return rules
@@ -0,0 +1,72 @@
+# HyperLogLog sketches for approximate distinct customer counts over rollup cells
+import pandas as pd
+import numpy as np
+from profiling import pipeline_stage
+
+# Sketch grain: one sparse HyperLogLog per (day, country, customer segment) cell,
+# stored as the non-zero (Register, Rank) pairs of the cell
+SKETCH_KEYS = ['Date', 'Country', 'CustomerSegment']
+
+# 2 ** PRECISION registers per sketch. The relative standard error of an
+# estimate is 1.04 / sqrt(registers): 1.6% at precision 12, so about 95% of
+# estimates fall within 3.3% of the exact count. Counts below 2.5 * registers
+# use linear counting, which is at least as accurate
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+STANDARD_ERROR = 1.04 / np.sqrt(REGISTERS)
+
+def _bit_length(values):
+    """Number of significant bits of each uint64 value"""
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    # frexp exponents are exact bit lengths for 32-bit integers
+    return np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1])
+
+def register_ranks(values, precision=PRECISION):
+    """HyperLogLog register index and rank (leading zeros + 1 after the index bits) of each value's hash"""
+    hashes = pd.util.hash_pandas_object(pd.Series(values), index=False).to_numpy()
+    registers = (hashes >> np.uint64(64 - precision)).astype(np.uint16)
+    rest = hashes << np.uint64(precision)
+    ranks = np.minimum(64 - _bit_length(rest) + 1, 64 - precision + 1).astype(np.uint8)
+    return registers, ranks
+
+@pipeline_stage
+def build_customer_sketches(df, precision=PRECISION):
+    """Sparse CustomerID HyperLogLog registers per (Date, Country, CustomerSegment) cell"""
+    registers, ranks = register_ranks(df['CustomerID'], precision)
+    sketches = pd.DataFrame({
+        'Date': df['InvoiceDate'].dt.normalize(),
+        'Country': df['Country'],
+        'CustomerSegment': df['CustomerSegment'],
+        'Register': registers,
+        'Rank': ranks
+    })
+    return sketches.groupby(SKETCH_KEYS + ['Register'], observed=True, dropna=False)['Rank'].max().reset_index()
+
+def combine_sketches(sketches):
+    """Merge partial sketch tables; a register keeps its highest rank"""
+    sketches = pd.concat(sketches, ignore_index=True)
+    return sketches.groupby(SKETCH_KEYS + ['Register'], observed=True, dropna=False, sort=True)['Rank'].max().reset_index()
+
+def estimate(registers):
+    """HyperLogLog cardinality estimate of each row of a (sketches x registers) rank array"""
+    m = registers.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.exp2(-registers.astype(np.float64)), axis=-1)
+    # Linear counting while many registers are still empty
+    zeros = np.count_nonzero(registers == 0, axis=-1)
+    linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+def distinct_count(sketches, groups=None, precision=PRECISION):
+    """Estimated distinct customers over sketch rows: a number, or a Series per group label when groups are given"""
+    codes, labels = (np.zeros(len(sketches), dtype=np.intp), None) if groups is None else pd.factorize(groups, sort=True)
+    n_groups = 1 if groups is None else len(labels)
+
+    # Merging sketches is a per-register maximum
+    registers = np.zeros((n_groups, 1 << precision), dtype=np.uint8)
+    np.maximum.at(registers, (codes, sketches['Register'].to_numpy(dtype=np.intp)), sketches['Rank'].to_numpy())
+    counts = np.rint(estimate(registers)).astype(np.int64)
+    if groups is None:
+        return int(counts[0])
+    return pd.Series(counts, index=labels)
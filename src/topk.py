@@ -0,0 +1,61 @@
+# Top-N rankings from per-key totals
+#
+# A key column is reduced to integer codes once, a measure is summed per code
+# with a single bincount pass, and the k largest totals are picked with
+# argpartition instead of sorting every key. The totals are returned as a
+# Series so callers can keep them and rank them again for any k
+import numpy as np
+import pandas as pd
+
+def key_codes(keys):
+    """Integer codes of a key column (-1 for missing) and the key values they index, in sorted order"""
+    if isinstance(keys.dtype, pd.CategoricalDtype):
+        return keys.cat.codes.to_numpy(), keys.cat.categories
+    return pd.factorize(keys, sort=True)
+
+def group_totals(keys, weights):
+    """Sum of the weights per key, for the keys present, like groupby(keys, observed=True).sum()"""
+    codes, labels = key_codes(keys)
+    present = codes >= 0
+    codes = codes[present]
+    counts = np.bincount(codes, minlength=len(labels))
+    sums = np.bincount(codes, weights=weights.to_numpy(dtype=np.float64)[present],
+                       minlength=len(labels)).astype(np.float64, copy=False)
+    # Integer measures sum exactly in float64 well past any realistic total
+    if pd.api.types.is_integer_dtype(weights.dtype):
+        sums = sums.round().astype(np.int64)
+
+    observed = counts > 0
+    return pd.Series(sums[observed], index=pd.Index(labels[observed], name=keys.name), name=weights.name)
+
+def group_distinct(keys, values):
+    """Distinct non-missing values per key, for the keys present, like groupby(keys, observed=True).nunique()"""
+    codes, labels = key_codes(keys)
+    value_codes, value_labels = key_codes(values)
+    present = (codes >= 0) & (value_codes >= 0)
+
+    # Each distinct (key, value) pair is counted once towards its key
+    pairs = np.unique(codes[present].astype(np.int64) * len(value_labels) + value_codes[present])
+    counts = np.bincount(pairs // max(len(value_labels), 1), minlength=len(labels))
+
+    observed = np.bincount(codes[codes >= 0], minlength=len(labels)) > 0
+    return pd.Series(counts[observed], index=pd.Index(labels[observed], name=keys.name), name=values.name)
+
+def top_k(totals, k):
+    """The k largest totals in descending order, ties kept in key order like Series.nlargest(k)"""
+    values = totals.to_numpy()
+    k = max(min(k, len(values)), 0)
+    if k == 0:
+        return totals.iloc[:0]
+
+    if k < len(values):
+        # Everything above the k-th largest total, then the first keys tied with it
+        kth = values[np.argpartition(values, len(values) - k)[len(values) - k]]
+        above = np.flatnonzero(values > kth)
+        ties = np.flatnonzero(values == kth)[:k - len(above)]
+        candidates = np.concatenate([above, ties])
+    else:
+        candidates = np.arange(len(values))
+
+    order = candidates[np.lexsort((candidates, -values[candidates]))]
+    return totals.iloc[order]
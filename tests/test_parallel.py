@@ -0,0 +1,67 @@
+# Parity of the process-parallel pipeline with the single-process run
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import feature_engineering
+from data_store import load_table
+
+# Row order of each saved table is not part of the contract, so tables are compared sorted by these keys
+TABLE_KEYS = {
+    'featured_data': ['InvoiceNo', 'StockCode', 'InvoiceDate', 'Quantity', 'UnitPrice'],
+    'customer_features': ['CustomerID'],
+    'product_features': ['StockCode'],
+    'country_features': ['Country'],
+    'rollup_cube': ['Date', 'Hour', 'Country', 'CustomerSegment'],
+    'customer_sketches': ['Date', 'Country', 'CustomerSegment', 'Register']
+}
+
+def write_source(path, n_invoices=600, seed=0):
+    """Cleaned-source CSV of random invoices where about a tenth have no CustomerID, as in the real data"""
+    rng = np.random.default_rng(seed)
+    lines = rng.integers(1, 8, n_invoices)
+    invoice = np.repeat(np.arange(n_invoices), lines)
+    customers = rng.integers(12000, 12300, n_invoices).astype(float)
+    customers[rng.random(n_invoices) < 0.1] = np.nan
+    dates = pd.Timestamp('2010-12-01 08:00') + pd.to_timedelta(np.sort(rng.integers(0, 365 * 24 * 60, n_invoices)), unit='min')
+    stock_codes = rng.integers(10000, 10200, len(invoice))
+    pd.DataFrame({
+        'InvoiceNo': 536365 + invoice,
+        'StockCode': stock_codes,
+        'Description': [f'PRODUCT {code - 10000}' for code in stock_codes],
+        'Quantity': rng.integers(1, 30, len(invoice)),
+        'InvoiceDate': dates[invoice].strftime('%Y-%m-%d %H:%M:%S'),
+        'UnitPrice': rng.integers(10, 1000, len(invoice)) / 100,
+        'CustomerID': customers[invoice],
+        'Country': rng.choice(['UNITED KINGDOM', 'FRANCE', 'GERMANY'], n_invoices)[invoice]
+    }).to_csv(path, index=False)
+
+def sorted_table(df, keys):
+    """Table with categories as plain values, sorted by its keys"""
+    df = df.astype({col: object for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)})
+    return df.sort_values(keys, kind='mergesort').reset_index(drop=True)
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    """Point the pipeline at a synthetic source; tables and incremental state go to each run's output directory"""
+    path = tmp_path / 'Online_Retail_Cleaned.csv'
+    write_source(path)
+    monkeypatch.setattr(feature_engineering, 'SOURCE_PATH', str(path))
+    return tmp_path
+
+def test_parallel_matches_full_run_with_missing_customer_ids(source):
+    full_dir, parallel_dir = source / 'full', source / 'parallel'
+    full_dir.mkdir()
+    parallel_dir.mkdir()
+
+    feature_engineering.main(output_dir=str(full_dir))
+    feature_engineering.run_parallel(n_jobs=2, output_dir=str(parallel_dir))
+
+    customers = load_table('customer_features', data_dir=str(parallel_dir))
+    assert 'UNKNOWN_CUSTOMER' in set(customers['CustomerID'].astype(str))
+    for table, keys in TABLE_KEYS.items():
+        full = sorted_table(load_table(table, data_dir=str(full_dir)), keys)
+        parallel = sorted_table(load_table(table, data_dir=str(parallel_dir)), keys)
+        pd.testing.assert_frame_equal(full, parallel, check_dtype=False, obj=table)